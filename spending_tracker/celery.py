@@ -2,10 +2,27 @@ from celery import Celery
 from celery.schedules import crontab
 
 app = Celery('spending_tracker_app')
+app.config_from_object('django.conf:settings', namespace='CELERY')
 app.conf.beat_schedule = {
     'cleanup-unverified-users-every-5-minutes': {
         'task': 'spending_tracker_app.tasks.cleanup_unverified_users',
         'schedule': crontab(minute='*/5'),  # Runs every 5 minutes
     },
+    'refresh-exchange-rates-every-6-hours': {
+        'task': 'spending_tracker_app.tasks.refresh_exchange_rates',
+        'schedule': crontab(minute=0, hour='*/6'),  # Runs every 6 hours
+    },
+    'advance-plan-statuses-nightly': {
+        'task': 'spending_tracker_app.tasks.advance_plan_statuses',
+        'schedule': crontab(minute=5, hour=0),  # Runs just after midnight UTC
+    },
+    'cleanup-expired-reports-hourly': {
+        'task': 'spending_tracker_app.tasks.cleanup_expired_reports',
+        'schedule': crontab(minute=15),  # Runs every hour
+    },
+    'reconcile-plan-balances-nightly': {
+        'task': 'spending_tracker_app.tasks.reconcile_plan_balances',
+        'schedule': crontab(minute=30, hour=23),  # Runs before plans are advanced at midnight
+    },
 }
 app.conf.timezone = 'UTC'
\ No newline at end of file
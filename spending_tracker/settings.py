@@ -67,6 +67,22 @@ DATABASES = {
     )
 }
 
+# Shared Redis cache when REDIS_URL is set, otherwise a per-process LRU cache
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('LOCMEM_CACHE_MAX_ENTRIES', 1000))},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -86,6 +102,9 @@ STATICFILES_DIRS = [BASE_DIR / "spending_tracker_app/static"]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# Uploaded and generated files (background reports are written to MEDIA_ROOT/reports/)
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Auth redirect settings
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -99,4 +118,40 @@ EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True').lower() == 'true'
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
-EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+
+# Exchange rate tables are cached per process for this many seconds
+EXCHANGE_RATE_CACHE_TTL = int(os.getenv('EXCHANGE_RATE_CACHE_TTL', 3600))
+# After a failed fetch, wait this many seconds before asking the provider again
+EXCHANGE_RATE_RETRY_AFTER = int(os.getenv('EXCHANGE_RATE_RETRY_AFTER', 60))
+# The only rate table fetched and stored; every other pair is crossed from it
+EXCHANGE_RATE_PIVOT_CURRENCY = os.getenv('EXCHANGE_RATE_PIVOT_CURRENCY', 'USD')
+# Maximum number of currencies whose rate history is kept in the in-memory historical rate index
+EXCHANGE_RATE_INDEX_MAX_CURRENCIES = int(os.getenv('EXCHANGE_RATE_INDEX_MAX_CURRENCIES', 256))
+# Exchange rate provider HTTP client: per-attempt timeout, retries with jittered back-off,
+# and the circuit breaker that fails fast after repeated errors
+EXCHANGE_RATE_HTTP_TIMEOUT = float(os.getenv('EXCHANGE_RATE_HTTP_TIMEOUT', 5))
+EXCHANGE_RATE_HTTP_RETRIES = int(os.getenv('EXCHANGE_RATE_HTTP_RETRIES', 2))
+EXCHANGE_RATE_HTTP_BACKOFF = float(os.getenv('EXCHANGE_RATE_HTTP_BACKOFF', 0.5))
+EXCHANGE_RATE_CIRCUIT_THRESHOLD = int(os.getenv('EXCHANGE_RATE_CIRCUIT_THRESHOLD', 5))
+EXCHANGE_RATE_CIRCUIT_RESET = int(os.getenv('EXCHANGE_RATE_CIRCUIT_RESET', 60))
+# Seconds a computed chart dataset stays cached; any data change invalidates it sooner
+CHART_DATA_CACHE_TIMEOUT = int(os.getenv('CHART_DATA_CACHE_TIMEOUT', 3600))
+# Upper bound (and default) for the points in each chart trend series; longer series are downsampled
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 500))
+# Seconds computed spending analytics stay cached; any data change invalidates them sooner
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv('ANALYTICS_CACHE_TIMEOUT', 3600))
+# Plans moved per UPDATE by the nightly advance_plan_statuses task
+PLAN_STATUS_CHUNK_SIZE = int(os.getenv('PLAN_STATUS_CHUNK_SIZE', 1000))
+# Users whose plans are reconciled per batch by reconcile_plan_balances
+RECONCILE_USER_CHUNK_SIZE = int(os.getenv('RECONCILE_USER_CHUNK_SIZE', 500))
+# Transactions read and converted per batch when writing reports
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', 2000))
+# Bytes of a generated report kept in memory before it is spooled to a temporary file
+REPORT_SPOOL_MAX_SIZE = int(os.getenv('REPORT_SPOOL_MAX_SIZE', 10 * 1024 * 1024))
+# Seconds a background report's download link stays valid; the file is deleted afterwards
+REPORT_URL_MAX_AGE = int(os.getenv('REPORT_URL_MAX_AGE', 3600))
+# Seconds without progress after which an unfinished report job is considered stalled
+REPORT_JOB_STALE_AFTER = int(os.getenv('REPORT_JOB_STALE_AFTER', 900))
+# Run Celery tasks inline instead of on a worker (local development without a broker)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() == 'true'
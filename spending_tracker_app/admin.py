@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Transaction, Plan
+from .models import Category, Transaction, Plan, ExchangeRate
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,4 +14,9 @@ class TransactionAdmin(admin.ModelAdmin):
 @admin.register(Plan)
 class PlanAdmin(admin.ModelAdmin):
     list_display = ('type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'status')
-    filter_horizontal = ('categories',)
\ No newline at end of file
+    filter_horizontal = ('categories',)
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('date', 'base_currency', 'currency', 'rate', 'fetched_at')
+    list_filter = ('base_currency', 'date')
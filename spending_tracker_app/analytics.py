@@ -0,0 +1,178 @@
+import datetime
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from .models import Category, DailyCategoryTotal
+from .exchange_rates import PIVOT_CURRENCY, get_exchange_rate, get_rates_version, historical_rate_index
+from .versioning import get_data_version
+
+logger = logging.getLogger(__name__)
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+ROLLING_WINDOWS = (30, 90)
+ANOMALY_Z_SCORE = 3.0
+MAX_ANOMALIES = 10
+
+
+def pivot_rates_on(currency, days):
+    """
+    The PIVOT_CURRENCY -> currency rate in effect on each of days (days since the epoch) as float64,
+    found for all of them with one np.searchsorted over the currency's stored daily rates.
+    Days before the first snapshot use it. Returns None if no snapshot is stored for currency.
+    """
+    if currency == PIVOT_CURRENCY:
+        return np.ones(len(days))
+    series_days, series_rates = historical_rate_index.series(currency)
+    if not series_days:
+        return None
+    series_days = np.array(series_days, dtype=np.int64) - EPOCH_ORDINAL
+    series_rates = np.array([float(rate) for rate in series_rates])
+    return series_rates[np.maximum(np.searchsorted(series_days, days, side='right') - 1, 0)]
+
+
+def conversion_rates(days, currency_codes, currency_names, display_currency):
+    """
+    The rate from each row's currency (an index into currency_names) to display_currency on the
+    row's day, crossed through the pivot like convert_many. Currencies without stored history on
+    either side fall back to the latest rate, also like convert_many.
+    """
+    rates = np.ones(len(days))
+    to_rates = pivot_rates_on(display_currency, days)
+    for code, currency in enumerate(currency_names):
+        if currency == display_currency:
+            continue
+        rows = currency_codes == code
+        from_rates = pivot_rates_on(currency, days[rows]) if to_rates is not None else None
+        if from_rates is not None:
+            rates[rows] = to_rates[rows] / from_rates
+        else:
+            rates[rows] = float(get_exchange_rate(currency, display_currency))
+    return rates
+
+
+def load_spending_arrays(user, display_currency):
+    """
+    Loads the user's spending as NumPy arrays, read from the daily totals so there is one
+    row per (day, category, currency) instead of one per transaction.
+    Returns (days, amounts, spent, category_codes, category_names): days since the epoch as int64,
+    amounts as float64 in display_currency, a bool mask of spending rows (all of them, as earnings
+    are left in the database) and integer codes indexing into category_names. Amounts are cast to
+    floats by the database and converted as one vector multiplication by the per-row rates of
+    conversion_rates; category names are looked up once per category rather than joined per row.
+    """
+    rows = list(
+        DailyCategoryTotal.objects.filter(user=user, status='spent')
+        .values_list('date', Cast('amount', FloatField()), 'currency', 'category_id')
+    )
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, np.empty(0, dtype=np.float64), np.empty(0, dtype=bool), empty, []
+    dates, raw_amounts, currencies, category_ids = zip(*rows)
+    days = np.fromiter((d.toordinal() - EPOCH_ORDINAL for d in dates), dtype=np.int64, count=len(rows))
+    currency_names, currency_codes = np.unique(np.array(currencies), return_inverse=True)
+    amounts = np.array(raw_amounts, dtype=np.float64)
+    amounts *= conversion_rates(days, currency_codes, currency_names.tolist(), display_currency)
+    ids, id_codes = np.unique(np.array(category_ids, dtype=np.int64), return_inverse=True)
+    names_by_id = dict(Category.objects.filter(id__in=ids.tolist()).values_list('id', 'name'))
+    category_names, name_codes = np.unique(np.array([names_by_id[i] for i in ids.tolist()], dtype=object),
+                                           return_inverse=True)
+    category_codes = name_codes[id_codes].astype(np.int64)
+    return days, amounts, np.ones(len(rows), dtype=bool), category_codes, list(category_names)
+
+
+def compute_spending_analytics(days, amounts, spent, category_codes, category_names, today):
+    """
+    Spending analytics over the arrays returned by load_spending_arrays, every step a whole-array pass:
+    - month_over_month: spending per category in the latest month with spending against the month
+      before it, with the relative change (None when the earlier month had no spending)
+    - rolling_averages: average daily spending over the last 30 and 90 days up to today
+    - anomalies: days whose total spending lies more than ANOMALY_Z_SCORE standard deviations above
+      the mean daily spending, most recent first
+    """
+    today_day = today.toordinal() - EPOCH_ORDINAL
+    result = {'month_over_month': [], 'rolling_averages': {f'{w}d': 0.0 for w in ROLLING_WINDOWS}, 'anomalies': []}
+    days, amounts, category_codes = days[spent], amounts[spent], category_codes[spent]
+    if days.size == 0:
+        return result
+
+    # Daily spending from the first spending day through today; days without spending count as zero
+    first_day = int(days.min())
+    span = max(today_day, int(days.max())) - first_day + 1
+    daily = np.bincount(days - first_day, weights=amounts, minlength=span)
+
+    # Windows end today; spending dated after today is left out and, if all of it is, averages stay zero
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    end = min(max(today_day - first_day + 1, 0), len(cumulative) - 1)
+    for window in ROLLING_WINDOWS:
+        start = max(end - window, 0)
+        result['rolling_averages'][f'{window}d'] = round(float((cumulative[end] - cumulative[start]) / window), 2)
+
+    # Month-over-month per category from a (category, month) spending matrix
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    latest_month = int(months.max())
+    in_range = months >= latest_month - 1
+    by_month = np.zeros((len(category_names), 2))
+    np.add.at(by_month, (category_codes[in_range], months[in_range] - (latest_month - 1)), amounts[in_range])
+    previous, current = by_month[:, 0], by_month[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (current - previous) / previous, np.nan)
+    month_label = str(np.datetime64(latest_month, 'M'))
+    for code in np.flatnonzero((previous > 0) | (current > 0)):
+        result['month_over_month'].append({
+            'category': category_names[code],
+            'month': month_label,
+            'current': round(float(current[code]), 2),
+            'previous': round(float(previous[code]), 2),
+            'change': None if np.isnan(change[code]) else round(float(change[code]), 4),
+        })
+
+    std = daily.std()
+    if std > 0:
+        z_scores = (daily - daily.mean()) / std
+        flagged = np.flatnonzero(z_scores > ANOMALY_Z_SCORE)[::-1][:MAX_ANOMALIES]
+        result['anomalies'] = [
+            {
+                'date': datetime.date.fromordinal(first_day + int(i) + EPOCH_ORDINAL).isoformat(),
+                'amount': round(float(daily[i]), 2),
+                'z_score': round(float(z_scores[i]), 2),
+            }
+            for i in flagged
+        ]
+    return result
+
+
+def spending_insights(analytics, currency):
+    """Short human readable observations drawn from compute_spending_analytics output."""
+    insights = []
+    for entry in analytics['month_over_month']:
+        if entry['change'] is not None and entry['change'] >= 0.25:
+            insights.append(f"Spending on {entry['category']} is up {entry['change']:.0%} on the previous month.")
+    averages = analytics['rolling_averages']
+    if averages['90d'] > 0 and averages['30d'] > averages['90d'] * 1.1:
+        insights.append(
+            f"Your last 30 days averaged {averages['30d']:.2f} {currency} a day, "
+            f"above your 90-day average of {averages['90d']:.2f} {currency}.")
+    if analytics['anomalies']:
+        latest = analytics['anomalies'][0]
+        insights.append(f"Unusually high spending of {latest['amount']:.2f} {currency} on {latest['date']}.")
+    return insights
+
+
+def get_spending_analytics(user, display_currency):
+    """
+    compute_spending_analytics for the user in display_currency, cached per data version, rates
+    version and day so it is only recomputed after the user's data changes, new rate snapshots
+    are stored or the rolling windows move on.
+    """
+    today = datetime.date.today()
+    key = (f"spending-analytics:{user.id}:{get_data_version(user)}:{get_rates_version()}:"
+           f"{today.isoformat()}:{display_currency}")
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = compute_spending_analytics(*load_spending_arrays(user, display_currency), today)
+        analytics['insights'] = spending_insights(analytics, display_currency)
+        cache.set(key, analytics, getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 3600))
+    return analytics
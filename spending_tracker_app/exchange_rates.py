@@ -0,0 +1,402 @@
+import os
+import threading
+import time
+import datetime
+import logging
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Max, Sum
+import requests
+from .models import ExchangeRate
+from .http_client import ProviderClient
+
+logger = logging.getLogger(__name__)
+
+# Exchange rate API configuration (using exchangerate-api.com with your valid API key)
+EXCHANGE_RATE_API_URL = "https://v6.exchangerate-api.com/v6"
+API_ACCESS_KEY = os.getenv('API_ACCESS_KEY_exchange')
+
+# Only the pivot currency's table is fetched and stored; every other pair is a cross rate
+PIVOT_CURRENCY = getattr(settings, 'EXCHANGE_RATE_PIVOT_CURRENCY', 'USD')
+RATE_PRECISION = Decimal('0.0000000001')  # Matches ExchangeRate.rate's decimal places
+
+# Hardcoded pivot rates (updated for accuracy as of Feb 2025). They seed the ExchangeRate table
+# and are the last resort when no snapshot has a currency. Reciprocal and cross pairs
+# (e.g. QAR -> EUR) are derived by cross_rate like any stored table.
+HARD_CODED_RATES_DATE = datetime.date(2025, 2, 1)
+HARD_CODED_RATES = {
+    'USD': Decimal('1'),
+    'QAR': Decimal('3.641'),  # 1 USD ≈ 3.641 QAR
+    'EUR': Decimal('0.924'),  # 1 USD ≈ 0.924 EUR
+}
+
+
+def cross_rate(from_rate, to_rate):
+    """
+    Returns the from -> to rate given both currencies' rates against the pivot,
+    at the fixed RATE_PRECISION. Returns None if either side is unknown.
+    """
+    if not from_rate or not to_rate:
+        return None
+    return (to_rate / from_rate).quantize(RATE_PRECISION)
+
+
+# Shared pooled, circuit-broken client for every call to the provider
+provider_client = ProviderClient(f"{EXCHANGE_RATE_API_URL}/{API_ACCESS_KEY}")
+
+
+def fetch_rate_table(base_currency, date=None, client=None):
+    """
+    Fetches the full conversion_rates map for base_currency from exchangerate-api.com.
+    If date is given, the historical table for that day is fetched instead of the latest one.
+    Returns a dict of currency code -> Decimal. Raises on network or API errors.
+    """
+    client = client or provider_client
+    if date is None:
+        data = client.get_json(f"latest/{base_currency}")
+    else:
+        data = client.get_json(f"history/{base_currency}/{date.year}/{date.month}/{date.day}")
+    if 'error' in data:
+        raise ValueError(f"API error: {data['error']}")
+    rates = {
+        code: Decimal(str(rate))
+        for code, rate in data['conversion_rates'].items()
+        if rate  # Skip missing or zero rates
+    }
+    if not rates:
+        raise ValueError(f"Empty rate table received for {base_currency}")
+    return rates
+
+
+def seed_exchange_rates():
+    """Inserts HARD_CODED_RATES as the oldest pivot snapshot so every seeded currency has a stored rate."""
+    ExchangeRate.objects.bulk_create(
+        [
+            ExchangeRate(base_currency=PIVOT_CURRENCY, currency=code, rate=rate, date=HARD_CODED_RATES_DATE)
+            for code, rate in HARD_CODED_RATES.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def store_rate_table(base_currency, rates, date=None):
+    """
+    Upserts one day's snapshot of a base currency's rate table, resets this process's rate
+    caches to pick it up and drops the shared rates version, so every process sees a new
+    get_rates_version() and recomputes what it converted at the older rates.
+    """
+    date = date or datetime.date.today()
+    ExchangeRate.objects.bulk_create(
+        [
+            ExchangeRate(base_currency=base_currency, currency=code, rate=rate, date=date)
+            for code, rate in rates.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['base_currency', 'currency', 'date'],
+        update_fields=['rate', 'fetched_at'],
+    )
+    rate_table_cache.clear()
+    historical_rate_index.clear()
+    cache.delete(RATES_VERSION_CACHE_KEY)
+
+
+def load_rate_table(base_currency):
+    """
+    Reads the most recent stored snapshot for base_currency from the database.
+    Never touches the network. Returns None if no snapshot exists.
+    """
+    latest = ExchangeRate.objects.filter(base_currency=base_currency).aggregate(latest=Max('date'))['latest']
+    if latest is None:
+        return None
+    return dict(
+        ExchangeRate.objects.filter(base_currency=base_currency, date=latest).values_list('currency', 'rate')
+    )
+
+
+class RateTableCache:
+    """
+    Process-wide cache of whole rate tables, keyed by base currency.
+
+    By default tables are read from the stored ExchangeRate snapshots, so request
+    workers never wait on the provider; the refresh_exchange_rates task keeps those
+    snapshots current.
+
+    A table is reused for `ttl` seconds. When it expires, exactly one caller
+    refreshes it while every other caller keeps reading the stale table; if
+    there is no table yet, concurrent callers wait on that single in-flight
+    fetch instead of each starting their own. A failed fetch is not retried
+    for `retry_after` seconds so an outage does not cost a timeout per call.
+    """
+
+    def __init__(self, fetcher=load_rate_table, ttl=None, retry_after=None):
+        self.fetcher = fetcher
+        self.ttl = ttl if ttl is not None else getattr(settings, 'EXCHANGE_RATE_CACHE_TTL', 3600)
+        self.retry_after = retry_after if retry_after is not None else getattr(
+            settings, 'EXCHANGE_RATE_RETRY_AFTER', 60)
+        self._lock = threading.Lock()
+        self._tables = {}  # base -> (rates, fetched_at)
+        self._failed_at = {}  # base -> monotonic time of the last failed fetch
+        self._inflight = {}  # base -> threading.Event set when the fetch finishes
+
+    def get_rates(self, base_currency):
+        """Returns the rate table for base_currency, or None if none could be loaded."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tables.get(base_currency)
+            if entry is not None and now - entry[1] < self.ttl:
+                return entry[0]
+            failed_at = self._failed_at.get(base_currency)
+            if failed_at is not None and now - failed_at < self.retry_after:
+                return entry[0] if entry else None
+            event = self._inflight.get(base_currency)
+            if event is None:
+                event = self._inflight[base_currency] = threading.Event()
+                leader = True
+            else:
+                leader = False
+                if entry is not None:
+                    return entry[0]  # Serve stale data while another caller refreshes
+
+        if not leader:
+            event.wait()
+            with self._lock:
+                entry = self._tables.get(base_currency)
+            return entry[0] if entry else None
+
+        try:
+            rates = self.fetcher(base_currency)
+            if rates is None:
+                raise ValueError("no rate table available")
+        except (requests.RequestException, DatabaseError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Failed to refresh rate table for {base_currency}: {str(e)}")
+            with self._lock:
+                self._failed_at[base_currency] = time.monotonic()
+            return entry[0] if entry else None
+        else:
+            with self._lock:
+                self._tables[base_currency] = (rates, time.monotonic())
+                self._failed_at.pop(base_currency, None)
+            logger.debug(f"Refreshed rate table for {base_currency} ({len(rates)} rates)")
+            return rates
+        finally:
+            with self._lock:
+                self._inflight.pop(base_currency, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._failed_at.clear()
+
+
+rate_table_cache = RateTableCache()
+
+
+def get_pivot_rate(currency):
+    """Returns 1 PIVOT_CURRENCY in currency from the cached pivot table or HARD_CODED_RATES, or None."""
+    if currency == PIVOT_CURRENCY:
+        return Decimal('1')
+    rates = rate_table_cache.get_rates(PIVOT_CURRENCY) or {}
+    return rates.get(currency) or HARD_CODED_RATES.get(currency)
+
+
+def get_latest_rate(from_currency, to_currency):
+    """Returns the latest from -> to cross rate, or None if either currency has no known rate."""
+    if from_currency == to_currency:
+        return Decimal('1')
+    return cross_rate(get_pivot_rate(from_currency), get_pivot_rate(to_currency))
+
+
+class HistoricalRateIndex:
+    """
+    In-memory index of stored daily pivot rates for date-accurate conversion.
+
+    Each currency is held as a sorted array of day ordinals plus a parallel list of
+    its rates against PIVOT_CURRENCY, and a rate for any day is found by bisecting to
+    the latest snapshot on or before it; pairs are crossed from two such series.
+    Currencies are loaded only when first used and at most `max_currencies` are kept
+    (least recently used are dropped). After `ttl` seconds a currency is topped up
+    with just the days stored since it was loaded instead of being reloaded.
+    """
+
+    def __init__(self, max_currencies=None, ttl=None):
+        self.max_currencies = max_currencies if max_currencies is not None else getattr(
+            settings, 'EXCHANGE_RATE_INDEX_MAX_CURRENCIES', 256)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'EXCHANGE_RATE_CACHE_TTL', 3600)
+        self._lock = threading.Lock()
+        self._series = OrderedDict()  # currency -> (day ordinals, rates, checked_at)
+
+    def _load(self, currency, since=None):
+        rows = ExchangeRate.objects.filter(base_currency=PIVOT_CURRENCY, currency=currency)
+        if since is not None:
+            rows = rows.filter(date__gte=since)
+        days = array('l')
+        rates = []
+        for date, rate in rows.order_by('date').values_list('date', 'rate'):
+            days.append(date.toordinal())
+            rates.append(rate)
+        return days, rates
+
+    def _get_series(self, currency):
+        key = currency
+        now = time.monotonic()
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+                if now - series[2] < self.ttl:
+                    return series
+
+        if series is None or not series[0]:
+            days, rates = self._load(currency)
+        else:
+            # Reload from the last known day, since today's snapshot may have been updated
+            last_day = series[0][-1]
+            new_days, new_rates = self._load(currency, since=datetime.date.fromordinal(last_day))
+            keep = bisect_right(series[0], last_day - 1)
+            days = series[0][:keep] + new_days
+            rates = series[1][:keep] + new_rates
+
+        series = (days, rates, now)
+        with self._lock:
+            self._series[key] = series
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_currencies:
+                self._series.popitem(last=False)
+        return series
+
+    def series(self, currency):
+        """Returns the (day ordinals, rates against PIVOT_CURRENCY) stored for currency, oldest first."""
+        days, rates, _ = self._get_series(currency)
+        return days, rates
+
+    def rates_on(self, currency, dates):
+        """
+        Returns the PIVOT_CURRENCY -> currency rate in effect on each of dates, or None
+        if no snapshot is stored for currency. Days before the first snapshot use it.
+        """
+        if currency == PIVOT_CURRENCY:
+            return [Decimal('1')] * len(dates)
+        days, rates, _ = self._get_series(currency)
+        if not days:
+            return None
+        return [rates[max(bisect_right(days, date.toordinal()) - 1, 0)] for date in dates]
+
+    def cross_rates_on(self, from_currency, to_currency, dates):
+        """Returns the from -> to rate in effect on each of dates, or None if either side has no history."""
+        from_rates = self.rates_on(from_currency, dates)
+        to_rates = self.rates_on(to_currency, dates) if from_rates is not None else None
+        if to_rates is None:
+            return None
+        return [cross_rate(f, t) for f, t in zip(from_rates, to_rates)]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+historical_rate_index = HistoricalRateIndex()
+
+
+RATES_VERSION_CACHE_KEY = 'exchange-rates:version'
+_loaded_rates_version = None  # The rates version this process's rate caches were filled under
+
+
+def get_rates_version():
+    """
+    Identifies the stored rate snapshots as the latest fetched_at among them, in microseconds
+    (0 when none are stored), so anything converted at the rates can be tagged with it.
+    Kept in the shared cache, which store_rate_table clears, so it is usually read without
+    a query. When it moves on, this process's rate caches are reset before they are used again.
+    """
+    global _loaded_rates_version
+    version = cache.get(RATES_VERSION_CACHE_KEY)
+    if version is None:
+        latest = ExchangeRate.objects.aggregate(latest=Max('fetched_at'))['latest']
+        version = int(latest.timestamp() * 1000000) if latest else 0
+        cache.set(RATES_VERSION_CACHE_KEY, version, getattr(settings, 'EXCHANGE_RATE_CACHE_TTL', 3600))
+    if version != _loaded_rates_version:
+        rate_table_cache.clear()
+        historical_rate_index.clear()
+        _loaded_rates_version = version
+    return version
+
+
+def get_exchange_rate(from_currency, to_currency):
+    """
+    Returns a Decimal representing the conversion rate (to/from_currency).
+    The rate is crossed from the cached pivot-currency table, which is backed by the ExchangeRate
+    snapshots kept current by the refresh_exchange_rates task, so this never calls the API.
+    Currencies missing from the table fall back to the hardcoded pivot rates.
+    Ensures a Decimal is always returned (never None).
+    """
+    rate = get_latest_rate(from_currency, to_currency)
+    if rate is None:
+        logger.warning(f"No exchange rate known for {from_currency} to {to_currency}, using 1")
+        rate = Decimal('1')
+    return rate  # Ensure a Decimal is returned, never None
+
+
+def convert_currency(amount, from_curr, to_curr, date=None):
+    """
+    Converts 'amount' from from_curr -> to_curr based on stored or hardcoded rates.
+    If date is given, the rate stored for that day is used instead of the latest one.
+    """
+    if date is not None:
+        return convert_many([(amount, from_curr, date)], to_curr)[0]
+    rate = get_exchange_rate(from_curr, to_curr)
+    if rate is None:  # Fallback if rate is somehow None (shouldn't happen with the above change)
+        logger.error(f"Rate for {from_curr} to {to_curr} is None, using default rate of 1")
+        rate = Decimal('1')
+    return amount * rate
+
+
+def convert_many(pairs, to_curr):
+    """
+    Converts a sequence of (amount, currency) or (amount, currency, date) tuples to to_curr
+    in one pass. Each distinct source currency's rate data is looked up exactly once, so
+    converting a whole queryset costs one lookup per currency instead of one per row.
+    Rows carrying a date are converted at the rate stored for that day, falling back to
+    the latest rate when no history exists for the pair.
+    Returns a list of converted amounts in the same order as pairs.
+    """
+    pairs = list(pairs)
+    row_rates = [None] * len(pairs)
+    dated_rows = {}  # currency -> indexes of rows that carry a date
+    for i, pair in enumerate(pairs):
+        if len(pair) > 2 and pair[2] is not None and pair[1] != to_curr:
+            dated_rows.setdefault(pair[1], []).append(i)
+    for currency, indexes in dated_rows.items():
+        rates = historical_rate_index.cross_rates_on(currency, to_curr, [pairs[i][2] for i in indexes])
+        if rates is not None:
+            for i, rate in zip(indexes, rates):
+                row_rates[i] = rate
+
+    latest_rates = {
+        currency: get_exchange_rate(currency, to_curr)
+        for currency in {pair[1] for pair, rate in zip(pairs, row_rates) if rate is None}
+    }
+    return [
+        pair[0] * (rate if rate is not None else latest_rates[pair[1]])
+        for pair, rate in zip(pairs, row_rates)
+    ]
+
+
+def convert_totals(transactions, to_curr):
+    """
+    Returns the earned and spent totals of a Transaction (or DailyCategoryTotal) queryset in to_curr.
+    Amounts are summed in the database per (status, currency, date) and each group is
+    converted once at that day's rate, which equals converting every row separately.
+    """
+    groups = list(transactions.order_by().values('status', 'currency', 'date').annotate(total=Sum('amount')))
+    converted_totals = convert_many(((g['total'], g['currency'], g['date']) for g in groups), to_curr)
+    totals = {'earned': Decimal('0'), 'spent': Decimal('0')}
+    for group, converted_total in zip(groups, converted_totals):
+        if group['status'] in totals:
+            totals[group['status']] += converted_total
+    return totals
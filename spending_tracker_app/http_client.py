@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+import logging
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Trips after `failure_threshold` consecutive failures and then rejects calls for
+    `reset_timeout` seconds. After that one trial call is let through (half-open):
+    success closes the circuit again, failure re-opens it for another timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return 'closed'
+        if now - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        """Raises CircuitOpenError if a call may not be made right now."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'open' or (state == 'half-open' and self._trial_running):
+                raise CircuitOpenError("Exchange rate provider circuit is open")
+            if state == 'half-open':
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Exchange rate provider circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+def build_session(pool_maxsize=10):
+    """Returns a requests.Session that keeps connections to the provider alive and pooled."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ProviderClient:
+    """
+    Shared HTTP client for the exchange rate provider.
+
+    All calls go through one pooled keep-alive session (or any object with a
+    requests-style get(url, timeout=...) passed as `transport`, e.g. a session
+    pointed at a local stub server in tests). Failed calls are retried with
+    jittered exponential back-off, and repeated failures trip a circuit breaker
+    so callers fail fast to cached or fallback rates while the provider is down.
+    """
+
+    def __init__(self, base_url, transport=None, timeout=None, retries=None, backoff=None, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.transport = transport if transport is not None else build_session()
+        self.timeout = timeout if timeout is not None else getattr(settings, 'EXCHANGE_RATE_HTTP_TIMEOUT', 5)
+        self.retries = retries if retries is not None else getattr(settings, 'EXCHANGE_RATE_HTTP_RETRIES', 2)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'EXCHANGE_RATE_HTTP_BACKOFF', 0.5)
+        self.breaker = breaker if breaker is not None else CircuitBreaker(
+            failure_threshold=getattr(settings, 'EXCHANGE_RATE_CIRCUIT_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'EXCHANGE_RATE_CIRCUIT_RESET', 60),
+        )
+
+    def get_json(self, path):
+        """GETs base_url/path and returns the decoded JSON body. Raises requests.RequestException on failure."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self.transport.get(url, timeout=self.timeout)
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise requests.HTTPError(f"{response.status_code} from exchange rate provider", response=response)
+                response.raise_for_status()
+                data = response.json()
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                retryable = e.response is None or e.response.status_code >= 500 or e.response.status_code == 429
+                if not retryable or attempt >= self.retries:
+                    raise
+                delay = random.uniform(0, self.backoff * (2 ** attempt))  # Full jitter
+                logger.warning(f"Exchange rate request failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self.breaker.record_success()
+                return data
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from spending_tracker_app.models import ExchangeRate, Transaction
+from spending_tracker_app.exchange_rates import fetch_rate_table, store_rate_table, PIVOT_CURRENCY
+import datetime
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Stores historical daily pivot-currency exchange rate snapshots for days that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to backfill (YYYY-MM-DD). Defaults to the oldest transaction.')
+        parser.add_argument('--end', help='Last day to backfill (YYYY-MM-DD). Defaults to today.')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start']) if options['start'] else None
+            end = datetime.date.fromisoformat(options['end']) if options['end'] else datetime.date.today()
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {str(e)}")
+        if start is None:
+            start = Transaction.objects.order_by('date').values_list('date', flat=True).first() or end
+
+        existing_days = set(
+            ExchangeRate.objects.filter(base_currency=PIVOT_CURRENCY, date__range=[start, end])
+            .values_list('date', flat=True).distinct()
+        )
+        stored = 0
+        day = start
+        while day <= end:
+            if day not in existing_days:
+                try:
+                    rates = fetch_rate_table(PIVOT_CURRENCY, date=day)
+                except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Failed to fetch {PIVOT_CURRENCY} rates for {day}: {str(e)}")
+                else:
+                    store_rate_table(PIVOT_CURRENCY, rates, date=day)
+                    stored += 1
+            day += datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully stored {stored} daily exchange rate snapshots."))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from spending_tracker_app.models import Category, Transaction
+from spending_tracker_app.exchange_rates import store_rate_table
+from spending_tracker_app.reports import spooled_excel_report
+from decimal import Decimal
+import datetime
+import random
+import resource
+import time
+import tracemalloc
+
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway transaction history and measures time and peak memory of the streaming '
+            'Excel export at growing sizes. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated row counts to export (default 1000,10000,100000).')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        try:
+            with transaction.atomic():
+                # Give every seeded day a stored rate so the run measures the export, not provider calls
+                for days_ago in range(3 * 365):
+                    store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('3.64'), 'EUR': Decimal('0.92')},
+                                     date=datetime.date.today() - datetime.timedelta(days=days_ago))
+                user = User.objects.create(username='benchmark_export_user', email='benchmark_export@example.com')
+                categories = Category.objects.bulk_create(
+                    [Category(name=name, user=user) for name in ('Food', 'Rent', 'Salary')])
+                seeded = 0
+                for size in sizes:
+                    self.seed(user, categories, seeded, size)
+                    seeded = size
+                    self.measure(user, size)
+                raise _Rollback()
+        except _Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS("Benchmark finished; seeded data was rolled back."))
+
+    def seed(self, user, categories, start, end):
+        random.seed(start)
+        today = datetime.date.today()
+        batch = []
+        for i in range(start, end):
+            batch.append(Transaction(
+                user=user,
+                date=today - datetime.timedelta(days=random.randrange(3 * 365)),
+                status='earned' if random.random() < 0.2 else 'spent',
+                category=random.choice(categories),
+                amount=Decimal(random.randrange(100, 100000)) / 100,
+                currency=random.choice(['QAR', 'USD', 'EUR']),
+                description=f'benchmark transaction {i}',
+            ))
+            if len(batch) == 5000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        Transaction.objects.bulk_create(batch)
+
+    def measure(self, user, size):
+        tracemalloc.start()
+        started = time.perf_counter()
+        report = spooled_excel_report(Transaction.objects.filter(user=user), 'QAR')
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report.seek(0, 2)
+        report_size = report.tell()
+        report.close()
+        # ru_maxrss is in kilobytes on Linux and only ever grows, so it bounds the whole run so far
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"  {size} rows: {elapsed:.2f} s, peak traced memory {peak / 2 ** 20:.1f} MiB, "
+                          f"file {report_size / 2 ** 20:.1f} MiB, process max RSS {max_rss:.0f} MiB")
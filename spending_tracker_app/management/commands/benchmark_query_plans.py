@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection
+from spending_tracker_app.models import Category, Transaction, Plan
+from decimal import Decimal
+import datetime
+import random
+import re
+import time
+
+class Command(BaseCommand):
+    help = ('Creates a throwaway test database, seeds it and prints the query plans of the hot transaction '
+            'and plan queries with and without the composite indexes. The configured database is never touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Transactions to seed (default 100000).')
+        parser.add_argument('--users', type=int, default=100, help='Users to spread them over (default 100).')
+
+    def handle(self, *args, **options):
+        # Indexes are dropped during the run, so it works on a freshly migrated test database like the test runner's
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user, category = self.seed(options['rows'], options['users'])
+            queries = self.hot_queries(user, category)
+            self.report('With indexes', queries)
+            self.drop_indexes()
+            self.report('Without indexes', queries)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(self.style.SUCCESS("Benchmark finished; the throwaway database was destroyed."))
+
+    def seed(self, rows, user_count):
+        random.seed(42)
+        users = User.objects.bulk_create(
+            [User(username=f'benchmark_user_{i}', email=f'benchmark_{i}@example.com') for i in range(user_count)]
+        )
+        categories = Category.objects.bulk_create(
+            [Category(name=name, user=user) for user in users for name in ('Food', 'Rent', 'Salary')]
+        )
+        today = datetime.date.today()
+        batch = []
+        for i in range(rows):
+            user_index = i % user_count
+            batch.append(Transaction(
+                user=users[user_index],
+                date=today - datetime.timedelta(days=random.randrange(3 * 365)),
+                status='earned' if random.random() < 0.2 else 'spent',
+                category=categories[user_index * 3 + random.randrange(3)],
+                amount=Decimal(random.randrange(100, 100000)) / 100,
+                currency=random.choice(['QAR', 'USD', 'EUR']),
+                description='benchmark',
+            ))
+            if len(batch) == 5000:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        Transaction.objects.bulk_create(batch)
+        Plan.objects.bulk_create([
+            Plan(user=user, type='monthly', amount=Decimal('1000'), left_money=Decimal('1000'), description='benchmark',
+                 from_date=today - datetime.timedelta(days=30 * m), to_date=today - datetime.timedelta(days=30 * m - 30),
+                 status='Active' if m == 0 else 'Completed')
+            for user in users for m in range(12)
+        ])
+        with connection.cursor() as cursor:
+            for model in (Transaction, Plan):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        self.stdout.write(f"Seeded {rows} transactions for {user_count} users.")
+        return users[0], categories[0]
+
+    def hot_queries(self, user, category):
+        today = datetime.date.today()
+        last_year = today - datetime.timedelta(days=365)
+        return [
+            ('Transaction listing (user, -date, -id)',
+             Transaction.objects.filter(user=user).order_by('-date', '-id')[:50]),
+            ('Spent in date range (user, status, date)',
+             Transaction.objects.filter(user=user, status='spent', date__range=[last_year, today])),
+            ('Category in date range (user, category, date)',
+             Transaction.objects.filter(user=user, category=category, date__range=[last_year, today])),
+            ('Active plans covering today (partial index)',
+             Plan.objects.filter(user=user, status='Active', from_date__lte=today, to_date__gte=today)),
+        ]
+
+    def drop_indexes(self):
+        """Drops the composite indexes and the plain user_id foreign key indexes the planner would fall back on."""
+        with connection.cursor() as cursor:
+            for model in (Transaction, Plan):
+                table = model._meta.db_table
+                constraints = connection.introspection.get_constraints(cursor, table)
+                names = [index.name for index in model._meta.indexes]
+                names += [
+                    name for name, info in constraints.items()
+                    if info['index'] and not info['unique'] and not info['primary_key'] and info['columns'] == ['user_id']
+                ]
+                for name in names:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                cursor.execute(f'ANALYZE {table}')
+
+    def is_sequential(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in plan
+        # SQLite reports full table scans as "SCAN <table>" and index lookups as "SEARCH ... USING INDEX"
+        return any(re.search(r'\bSCAN\b', line) and 'USING' not in line for line in plan.splitlines())
+
+    def report(self, title, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for label, queryset in queries:
+            plan = queryset.explain()
+            started = time.perf_counter()
+            list(queryset.all())  # Fresh clone so the result cache of an earlier run is not reused
+            elapsed = (time.perf_counter() - started) * 1000
+            scan = 'SEQ SCAN' if self.is_sequential(plan) else 'INDEX SCAN'
+            self.stdout.write(f"  {label}: {scan}, {elapsed:.1f} ms")
+            for line in plan.splitlines():
+                self.stdout.write(f"      {line}")
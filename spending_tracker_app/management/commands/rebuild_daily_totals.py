@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from spending_tracker_app.rollups import rebuild_daily_totals
+
+class Command(BaseCommand):
+    help = 'Recomputes the DailyCategoryTotal rollup rows from the transactions table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this username. Defaults to every user.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+        rows = rebuild_daily_totals(user)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily category totals."))
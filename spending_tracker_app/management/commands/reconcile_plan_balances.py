@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from spending_tracker_app.reconciliation import reconcile_plan_balances
+
+class Command(BaseCommand):
+    help = ('Recomputes Plan.left_money from the spent transactions of each plan and fixes the '
+            'plans whose stored balance has drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile this username. Defaults to every user.')
+        parser.add_argument('--chunk-size', type=int, help='Users processed per batch (default RECONCILE_USER_CHUNK_SIZE).')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing anything.')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['user']:
+            try:
+                user_ids = [User.objects.get(username=options['user']).id]
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+        stats = reconcile_plan_balances(user_ids, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        action = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(f"Checked {stats['plans']} plans.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {stats['drifted']} drifted plans of {stats['users']} users "
+            f"(total drift {stats['total_drift']}, largest {stats['max_drift']})."))
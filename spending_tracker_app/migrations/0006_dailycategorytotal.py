@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_daily_totals(apps, schema_editor):
+    Transaction = apps.get_model('spending_tracker_app', 'Transaction')
+    DailyCategoryTotal = apps.get_model('spending_tracker_app', 'DailyCategoryTotal')
+    groups = Transaction.objects.order_by().values('user_id', 'date', 'category_id', 'status', 'currency') \
+        .annotate(total=Sum('amount'), rows=Count('id'))
+    DailyCategoryTotal.objects.bulk_create(
+        (DailyCategoryTotal(user_id=g['user_id'], date=g['date'], category_id=g['category_id'], status=g['status'],
+                            currency=g['currency'], amount=g['total'], count=g['rows'])
+         for g in groups.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_tracker_app', '0005_changelogentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('spent', 'Spent'), ('earned', 'Earned')], max_length=10)),
+                ('currency', models.CharField(max_length=3)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='spending_tracker_app.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date', 'category', 'status', 'currency')},
+            },
+        ),
+        migrations.RunPython(populate_daily_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_tracker_app', '0008_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_tracker_app', '0009_reportjob_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfinancialsummary',
+            name='rates_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
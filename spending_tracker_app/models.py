@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 import datetime
+import uuid
+from decimal import Decimal
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -9,6 +11,7 @@ class UserProfile(models.Model):
     verification_token = models.CharField(max_length=100, blank=True, null=True)
     token_expiry = models.DateTimeField(blank=True, null=True)
     preferred_currency = models.CharField(max_length=15, default='UZS')
+    data_version = models.PositiveBigIntegerField(default=0)  # Bumped on every Transaction/Category/Plan change
 
     def is_token_valid(self):
         return self.token_expiry is not None and timezone.now() < self.token_expiry
@@ -39,6 +42,16 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.status} - {self.amount} {self.currency}"
 
+    class Meta:
+        indexes = [
+            # Listing and keyset pagination: WHERE user = ? ORDER BY date DESC, id DESC
+            models.Index(fields=['user', '-date', '-id'], name='txn_user_date_id_idx'),
+            # Status filters and totals over a date range
+            models.Index(fields=['user', 'status', 'date'], name='txn_user_status_date_idx'),
+            # Category filters over a date range
+            models.Index(fields=['user', 'category', 'date'], name='txn_user_category_date_idx'),
+        ]
+
 class Plan(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     type = models.CharField(max_length=10, choices=[('monthly', 'Monthly'), ('custom', 'Custom')])
@@ -53,15 +66,149 @@ class Plan(models.Model):
     def __str__(self):
         return f"{self.type} Plan - {self.description}"
 
+    class Meta:
+        indexes = [
+            # Only active plans are adjusted by transactions, so index just those rows
+            models.Index(fields=['user', 'from_date', 'to_date'], name='plan_active_user_dates_idx',
+                         condition=models.Q(status='Active')),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.left_money:
             self.left_money = self.amount
         super().save(*args, **kwargs)
 
+    def current_status(self, today=None):
+        """The status the plan has on today, whether or not it has been stored yet."""
+        today = today or datetime.date.today()
+        to_date = self.to_date
+        if isinstance(to_date, str):  # Plans created from request data keep the raw string until reloaded
+            to_date = datetime.date.fromisoformat(to_date)
+        if today > to_date:
+            return 'Completed' if self.left_money <= 0 else 'Failed'
+        return 'Active'
+
+    @staticmethod
+    def status_expression(today):
+        """current_status as a database expression, for annotating or updating plans in bulk."""
+        return models.Case(
+            models.When(to_date__lt=today, left_money__lte=0, then=models.Value('Completed')),
+            models.When(to_date__lt=today, then=models.Value('Failed')),
+            default=models.Value('Active'),
+            output_field=models.CharField(max_length=10),
+        )
+
     def update_status(self):
-        today = datetime.date.today()
-        if today > self.to_date:
-            self.status = 'Completed' if self.left_money <= 0 else 'Failed'
-        else:
-            self.status = 'Active'
-        self.save()
\ No newline at end of file
+        status = self.current_status()
+        if status != self.status:  # Only write (and bump the user's data version) on a real change
+            self.status = status
+            self.save()
+
+class ExchangeRate(models.Model):
+    base_currency = models.CharField(max_length=3)
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)  # 1 base_currency = rate currency
+    date = models.DateField()  # Day of the snapshot
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.date}: 1 {self.base_currency} = {self.rate} {self.currency}"
+
+    class Meta:
+        unique_together = [['base_currency', 'currency', 'date']]  # One rate per pair per day
+
+class ChangeLogEntry(models.Model):
+    """
+    Latest change to one of a user's transactions, categories or plans. Each object keeps a
+    single entry (a later change overwrites it, a delete turns it into a tombstone), so the log
+    grows with the number of objects rather than with the number of edits.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    entity = models.CharField(max_length=12, choices=[('transaction', 'Transaction'), ('category', 'Category'),
+                                                      ('plan', 'Plan')])
+    object_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField()  # The user's data version this change produced
+    deleted = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.entity} {self.object_id} {'deleted' if self.deleted else 'changed'} at v{self.version}"
+
+    class Meta:
+        unique_together = [['user', 'entity', 'object_id']]
+        indexes = [
+            models.Index(fields=['user', 'version'], name='changelog_user_version_idx'),
+        ]
+
+class DailyCategoryTotal(models.Model):
+    """
+    Sum and count of a user's transactions per (date, category, status, currency), kept exact
+    by the Transaction signals. Field names match Transaction so the same filters and
+    aggregations run against either.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=[('spent', 'Spent'), ('earned', 'Earned')])
+    currency = models.CharField(max_length=3)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.category_id} {self.status}: {self.amount} {self.currency} ({self.count})"
+
+    class Meta:
+        unique_together = [['user', 'date', 'category', 'status', 'currency']]
+
+class UserFinancialSummary(models.Model):
+    """
+    A user's all-time earned and spent totals in one display currency. Created on first use
+    and then kept current by the Transaction signals, so the profile page reads one row.
+    Recomputed on read once newer rate snapshots are stored.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    currency = models.CharField(max_length=15)
+    total_earned = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    total_spent = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    rates_version = models.PositiveBigIntegerField(default=0)  # get_rates_version() the totals were converted at
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} {self.currency}: earned {self.total_earned}, spent {self.total_spent}"
+
+    @property
+    def ai_recommendation(self):
+        if self.total_spent > (Decimal('0.7') * self.total_earned) and self.total_earned > Decimal('0'):
+            return "Warning: You are overspending! Consider reducing expenses or revising your plans."
+        return "You are overspending if total spent exceeds 70% of total earned."
+
+    class Meta:
+        unique_together = [['user', 'currency']]
+
+class ReportJob(models.Model):
+    """
+    A report generated in the background. Jobs are keyed by a digest of their parameters and
+    the user's data version, so asking for the same report of unchanged data reuses the job.
+    """
+    STATUS_CHOICES = [('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    params = models.JSONField()
+    params_digest = models.CharField(max_length=64)
+    data_version = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Also touched by every progress update
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Report {self.id} ({self.status}, {self.rows_processed}/{self.rows_total})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'params_digest', 'data_version'], name='reportjob_dedup_idx'),
+        ]
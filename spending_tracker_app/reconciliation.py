@@ -0,0 +1,84 @@
+import logging
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from .models import Category, Plan, Transaction
+from .versioning import record_changes
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+
+def planned_spending(user_ids):
+    """
+    Returns {plan_id: spent} for the plans of user_ids in one grouped query: the spent
+    transactions of the plan's owner dated within from_date..to_date, in one of the plan's
+    categories or in any category when the plan tracks an "all" category.
+    Amounts are summed as stored, the same way deduct_from_plans takes them off.
+    """
+    if not user_ids:
+        return {}
+    quote = connection.ops.quote_name
+    plan_table = quote(Plan._meta.db_table)
+    transaction_table = quote(Transaction._meta.db_table)
+    category_table = quote(Category._meta.db_table)
+    plan_categories_table = quote(Plan.categories.through._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    sql = f"""
+        SELECT p.id, SUM(t.amount)
+        FROM {plan_table} p
+        JOIN {transaction_table} t
+          ON t.user_id = p.user_id AND t.status = 'spent' AND t.date BETWEEN p.from_date AND p.to_date
+        WHERE p.user_id IN ({placeholders})
+          AND EXISTS (
+            SELECT 1 FROM {plan_categories_table} pc
+            JOIN {category_table} c ON c.id = pc.category_id
+            WHERE pc.plan_id = p.id AND (pc.category_id = t.category_id OR LOWER(c.name) = 'all')
+          )
+        GROUP BY p.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, list(user_ids))
+        # SQLite hands SUM() of decimals back as floats, so normalise to cents
+        return {plan_id: Decimal(str(spent)).quantize(CENT) for plan_id, spent in cursor.fetchall()}
+
+
+def reconcile_plan_balances(user_ids=None, chunk_size=None, dry_run=False):
+    """
+    Recomputes left_money of every plan (or the plans of user_ids) from the transactions
+    ledger as max(0, amount - spent) and stores the plans that drifted, one chunk of users
+    at a time: one plan query, one aggregate query and one bulk_update per chunk.
+    With dry_run nothing is written. Returns drift statistics.
+    """
+    chunk_size = chunk_size or getattr(settings, 'RECONCILE_USER_CHUNK_SIZE', 500)
+    if user_ids is None:
+        user_ids = Plan.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    user_ids = list(user_ids)
+    stats = {'plans': 0, 'drifted': 0, 'users': 0, 'total_drift': Decimal('0'), 'max_drift': Decimal('0')}
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        plans = list(Plan.objects.filter(user_id__in=chunk).only('id', 'user_id', 'amount', 'left_money'))
+        spent = planned_spending(chunk)
+        drifted = []
+        for plan in plans:
+            expected = max(Decimal('0'), plan.amount - spent.get(plan.id, Decimal('0')))
+            drift = abs(plan.left_money - expected)
+            if drift:
+                stats['total_drift'] += drift
+                stats['max_drift'] = max(stats['max_drift'], drift)
+                plan.left_money = expected
+                drifted.append(plan)
+        stats['plans'] += len(plans)
+        stats['drifted'] += len(drifted)
+        plan_ids_by_user = {}
+        for plan in drifted:
+            plan_ids_by_user.setdefault(plan.user_id, []).append(plan.id)
+        stats['users'] += len(plan_ids_by_user)
+        if drifted and not dry_run:
+            with transaction.atomic():
+                Plan.objects.bulk_update(drifted, ['left_money'], batch_size=1000)
+                for user_id, plan_ids in plan_ids_by_user.items():
+                    record_changes(user_id, 'plan', plan_ids)
+    logger.debug(f"Reconciled {stats['plans']} plans, {stats['drifted']} had drifted by {stats['total_drift']} in total")
+    return stats
@@ -0,0 +1,271 @@
+import datetime
+import hashlib
+import json
+import logging
+import tempfile
+from itertools import islice
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+from reportlab.lib.pagesizes import LETTER
+from .models import ReportJob, Transaction
+from .exchange_rates import convert_many
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEADER = ['Date', 'Status', 'Category', 'Amount', 'Currency', 'Description']
+REPORT_FIELDS = ('date', 'status', 'category__name', 'amount', 'currency', 'description')
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+REPORT_PARAMS = ('start_date', 'end_date', 'status', 'category', 'format', 'filename', 'display_currency')
+REPORT_DOWNLOAD_SALT = 'spending_tracker_app.report-download'
+
+
+def report_params(data):
+    """The report parameters of a POST (or any mapping) with the defaults generate_report applies."""
+    params = {name: data.get(name) or '' for name in REPORT_PARAMS}
+    params['format'] = params['format'] or 'excel'
+    params['filename'] = params['filename'] or 'report'
+    params['display_currency'] = params['display_currency'] or 'QAR'
+    return params
+
+
+def report_transactions(user, params):
+    """The user's transactions matching the report parameters, filtered like the index view."""
+    transactions = Transaction.objects.filter(user=user)
+    if params['start_date'] and params['end_date']:
+        transactions = transactions.filter(date__range=[params['start_date'], params['end_date']])
+    if params['status'] and params['status'] != 'all':
+        transactions = transactions.filter(status=params['status'])
+    if params['category']:
+        transactions = transactions.filter(category__name=params['category'])
+    return transactions
+
+
+def report_rows(transactions, display_currency, chunk_size=None, progress=None):
+    """
+    Yields one (date, status, category, amount, currency, description) tuple per transaction with
+    the amount converted to display_currency. Rows are read with a server-side cursor and
+    converted one chunk at a time, so only a chunk is held in memory at once.
+    progress, if given, is called with the number of rows read so far after each chunk.
+    """
+    chunk_size = chunk_size or getattr(settings, 'REPORT_CHUNK_SIZE', 2000)
+    rows = transactions.values_list(*REPORT_FIELDS).iterator(chunk_size=chunk_size)
+    processed = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        converted_amounts = convert_many(((amount, currency, date) for date, _, _, amount, currency, _ in chunk),
+                                         display_currency)
+        for (date, status, category, _, _, description), converted_amount in zip(chunk, converted_amounts):
+            yield date, status, category or 'N/A', float(converted_amount), display_currency, description
+        processed += len(chunk)
+        if progress is not None:
+            progress(processed)
+
+
+def write_excel_report(transactions, display_currency, fileobj, progress=None):
+    """
+    Writes the transactions as an .xlsx workbook to fileobj. The workbook is in openpyxl's
+    write_only mode, which streams rows to disk as they are appended instead of keeping a
+    cell object for each of them. Returns the number of rows written.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Transactions')
+    sheet.append(REPORT_HEADER)
+    count = 0
+    for row in report_rows(transactions, display_currency, progress=progress):
+        sheet.append(row)
+        count += 1
+    workbook.save(fileobj)
+    return count
+
+
+def spooled_excel_report(transactions, display_currency):
+    """
+    write_excel_report into a temporary file that stays in memory up to REPORT_SPOOL_MAX_SIZE
+    bytes and moves to disk beyond that. Returns the file rewound to the start.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'REPORT_SPOOL_MAX_SIZE', 10 * 1024 * 1024))
+    count = write_excel_report(transactions, display_currency, spooled)
+    spooled.seek(0)
+    logger.debug(f"Wrote an Excel report of {count} transactions")
+    return spooled
+
+
+def write_pdf_report(transactions, display_currency, fileobj, progress=None):
+    """Writes the transactions as a PDF table to fileobj. Returns the number of rows written."""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    doc = SimpleDocTemplate(fileobj, pagesize=LETTER,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
+    flowables = []
+    styles = getSampleStyleSheet()
+    flowables.append(Paragraph("Spending Tracker Report", styles["Title"]))
+    flowables.append(Spacer(1, 12))  # some vertical space
+
+    # Define a custom style for wrapped text in the description
+    description_style = ParagraphStyle(
+        'DescriptionStyle',
+        parent=styles['Normal'],
+        wordWrap='CJK',  # Enables word wrapping
+        fontSize=10,
+        leading=12,
+    )
+
+    table_data = [REPORT_HEADER]
+    for date, status, category_name, amount, currency, description in report_rows(transactions, display_currency,
+                                                                                  progress=progress):
+        table_data.append([
+            date,
+            status,
+            category_name,
+            str(amount),
+            currency,
+            Paragraph(description, description_style),  # Wrap description text
+        ])
+
+    # Define column widths to ensure description has enough space
+    col_widths = [80, 60, 80, 60, 60, 200]  # Adjust 200 for description to allow wrapping
+    table = Table(table_data, colWidths=col_widths)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.Color(0.2, 0.5, 0.8)),  # bluish
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+        ("ALIGN", (3, 1), (4, -1), "RIGHT"),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        # Ensure description column wraps text
+        ("LEFTPADDING", (5, 1), (5, -1), 5),
+        ("RIGHTPADDING", (5, 1), (5, -1), 5),
+    ]))
+
+    flowables.append(table)
+
+    doc.build(flowables)
+    return len(table_data) - 1
+
+
+# format -> (file extension, content type, writer)
+REPORT_FORMATS = {
+    'excel': ('xlsx', EXCEL_CONTENT_TYPE, write_excel_report),
+    'pdf': ('pdf', 'application/pdf', write_pdf_report),
+}
+
+
+def stale_job_cutoff():
+    """Unfinished jobs whose last update is older than this have lost their worker or were never queued."""
+    return timezone.now() - datetime.timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_AFTER', 900))
+
+
+def find_or_create_report_job(user, params, data_version):
+    """
+    Returns (job, created). A finished, unexpired job for the same parameters and data version
+    is reused, as is one still pending or running that has made progress recently, so asking
+    again for a report of unchanged data costs nothing. Stale unfinished jobs are marked failed
+    and replaced.
+    """
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    jobs = ReportJob.objects.filter(user=user, params_digest=digest, data_version=data_version)
+    jobs.filter(status__in=['pending', 'running'], updated_at__lte=stale_job_cutoff()).update(
+        status='failed', error='Report job stalled', updated_at=timezone.now())
+    job = jobs.filter(
+        Q(status='done', expires_at__gt=timezone.now()) | Q(status__in=['pending', 'running'])
+    ).order_by('-created_at').first()
+    if job is not None:
+        return job, False
+    return ReportJob.objects.create(user=user, params=params, params_digest=digest, data_version=data_version), True
+
+
+def run_report_job(job_id):
+    """
+    Generates the report of a ReportJob into a spooled temporary file and stores it under
+    MEDIA_ROOT/reports/. Progress is written to the job after every chunk of rows, and the
+    finished file expires REPORT_URL_MAX_AGE seconds after it was written.
+    """
+    job = ReportJob.objects.select_related('user').get(id=job_id)
+    if job.status not in ('pending', 'running'):
+        return job
+    extension, _, writer = REPORT_FORMATS[job.params['format']]
+    transactions = report_transactions(job.user, job.params)
+    job.status = 'running'
+    job.rows_total = transactions.count()
+    job.save(update_fields=['status', 'rows_total'])
+
+    def progress(rows):
+        ReportJob.objects.filter(id=job.id).update(rows_processed=rows, updated_at=timezone.now())
+
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'REPORT_SPOOL_MAX_SIZE', 10 * 1024 * 1024)) as spooled:
+            rows = writer(transactions, job.params['display_currency'], spooled, progress=progress)
+            spooled.seek(0)
+            job.file.save(f"{job.id}.{extension}", File(spooled), save=False)
+    except Exception as e:
+        logger.error(f"Report job {job.id} failed: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error'])
+        return job
+    job.status = 'done'
+    job.rows_processed = rows
+    job.expires_at = timezone.now() + datetime.timedelta(seconds=getattr(settings, 'REPORT_URL_MAX_AGE', 3600))
+    job.save(update_fields=['status', 'rows_processed', 'file', 'expires_at'])
+    logger.debug(f"Report job {job.id} wrote {rows} rows")
+    return job
+
+
+def report_download_url(job):
+    """A download URL for a finished job, signed so that it stops working after REPORT_URL_MAX_AGE."""
+    token = signing.TimestampSigner(salt=REPORT_DOWNLOAD_SALT).sign(str(job.id))
+    return f"{reverse('spending_tracker_app:download_report', args=[job.id])}?token={token}"
+
+
+def check_download_token(job, token):
+    """True if token was signed for job by report_download_url and has not expired."""
+    try:
+        signed_id = signing.TimestampSigner(salt=REPORT_DOWNLOAD_SALT).unsign(
+            token or '', max_age=getattr(settings, 'REPORT_URL_MAX_AGE', 3600))
+    except signing.BadSignature:  # Also raised for expired tokens
+        return False
+    return signed_id == str(job.id)
+
+
+def report_job_status(job):
+    """The JSON body of the report status endpoint."""
+    data = {
+        'job_id': str(job.id),
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'rows_total': job.rows_total,
+    }
+    if job.status == 'done':
+        data['download_url'] = report_download_url(job)
+        data['expires_at'] = job.expires_at.isoformat()
+    elif job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def delete_expired_reports():
+    """
+    Deletes report jobs together with their files once they are of no further use: finished
+    jobs whose download has expired, and failed or stale unfinished jobs that have not been
+    updated for REPORT_JOB_STALE_AFTER seconds. Returns how many were removed.
+    """
+    expired = list(ReportJob.objects.filter(
+        Q(expires_at__lte=timezone.now())
+        | Q(status__in=['failed', 'pending', 'running'], updated_at__lte=stale_job_cutoff())
+    ))
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+    ReportJob.objects.filter(id__in=[job.id for job in expired]).delete()
+    return len(expired)
@@ -0,0 +1,66 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Count
+from .models import DailyCategoryTotal, Transaction, UserProfile, UserFinancialSummary
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY_FIELDS = ('user_id', 'date', 'category_id', 'status', 'currency')
+
+
+def rollup_key(obj):
+    """Returns the DailyCategoryTotal key of a Transaction (or a dict of its values)."""
+    if isinstance(obj, dict):
+        return tuple(obj[field] for field in ROLLUP_KEY_FIELDS)
+    return tuple(getattr(obj, field) for field in ROLLUP_KEY_FIELDS)
+
+
+def apply_rollup_delta(key, amount, count):
+    """
+    Adds amount and count to the DailyCategoryTotal row for key with a single F() UPDATE,
+    creating the row the first time a key is seen and dropping it once its count reaches 0.
+    """
+    lookup = dict(zip(ROLLUP_KEY_FIELDS, key))
+    with transaction.atomic():
+        updated = DailyCategoryTotal.objects.filter(**lookup).update(
+            amount=F('amount') + amount, count=F('count') + count)
+        if not updated and count > 0:
+            try:
+                with transaction.atomic():
+                    DailyCategoryTotal.objects.create(amount=amount, count=count, **lookup)
+            except IntegrityError:  # Another request created it first
+                DailyCategoryTotal.objects.filter(**lookup).update(
+                    amount=F('amount') + amount, count=F('count') + count)
+        elif count < 0:
+            DailyCategoryTotal.objects.filter(count=0, **lookup).delete()
+
+
+def rebuild_daily_totals(user=None, batch_size=1000):
+    """
+    Recomputes DailyCategoryTotal from the transactions of one user (or everyone) in one
+    grouped query. Used by the rebuild_daily_totals command and after bulk writes that
+    bypass the Transaction signals. Bumps the data version of the users it covers and drops
+    their financial summaries so cached aggregates are recomputed. Returns the number of
+    rollup rows written.
+    """
+    transactions = Transaction.objects.all()
+    rollups = DailyCategoryTotal.objects.all()
+    profiles = UserProfile.objects.all()
+    summaries = UserFinancialSummary.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        rollups = rollups.filter(user=user)
+        profiles = profiles.filter(user=user)
+        summaries = summaries.filter(user=user)
+    groups = transactions.order_by().values(*ROLLUP_KEY_FIELDS).annotate(total=Sum('amount'), rows=Count('id'))
+    with transaction.atomic():
+        rollups.delete()
+        created = DailyCategoryTotal.objects.bulk_create(
+            (DailyCategoryTotal(amount=g['total'], count=g['rows'], **dict(zip(ROLLUP_KEY_FIELDS, rollup_key(g))))
+             for g in groups.iterator()),
+            batch_size=batch_size,
+        )
+        profiles.update(data_version=F('data_version') + 1)
+        summaries.delete()
+    logger.debug(f"Rebuilt {len(created)} daily category totals")
+    return len(created)
@@ -1,8 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, Transaction, Category, Plan
+from .versioning import bump_data_version, record_change
+from .rollups import ROLLUP_KEY_FIELDS, rollup_key, apply_rollup_delta
+from .summaries import apply_summary_delta
+from decimal import Decimal
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -11,4 +16,94 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
         logger.debug(f"Created UserProfile for user {instance.username}")  # Enhanced debug
-        print(f"Created UserProfile for user {instance.username}")  # Console debug
\ No newline at end of file
+        print(f"Created UserProfile for user {instance.username}")  # Console debug
+
+# Users whose deletion is cascading through their rows in this thread. The per-row handlers
+# skip them: their change log, rollups and summaries go with them, and any row written for
+# them would point at the user being deleted. Rows signalled after the user row itself is
+# gone are skipped by record_change, which finds no profile left to version.
+_deleting = threading.local()
+
+def is_being_deleted(user_id):
+    return user_id in getattr(_deleting, 'user_ids', ())
+
+@receiver(pre_delete, sender=User)
+def start_user_deletion(sender, instance, **kwargs):
+    if not hasattr(_deleting, 'user_ids'):
+        _deleting.user_ids = set()
+    _deleting.user_ids.add(instance.pk)
+
+@receiver(post_delete, sender=User)
+def finish_user_deletion(sender, instance, **kwargs):
+    getattr(_deleting, 'user_ids', set()).discard(instance.pk)
+
+CHANGE_LOG_ENTITIES = {Transaction: 'transaction', Category: 'category', Plan: 'plan'}
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Plan)
+def record_saved_change(sender, instance, **kwargs):
+    if instance.user_id is not None:  # Global categories belong to no user
+        record_change(instance.user_id, CHANGE_LOG_ENTITIES[sender], instance.pk)
+
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Plan)
+def record_deleted_change(sender, instance, **kwargs):
+    if instance.user_id is not None and not is_being_deleted(instance.user_id):
+        record_change(instance.user_id, CHANGE_LOG_ENTITIES[sender], instance.pk, deleted=True)
+
+@receiver(m2m_changed, sender=Plan.categories.through)
+def record_plan_categories_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or instance.user_id is None:
+        return
+    if not reverse:
+        record_change(instance.user_id, 'plan', instance.pk)
+    elif pk_set:  # Changed from the Category side: pk_set holds the affected plans
+        for plan_id in pk_set:
+            record_change(instance.user_id, 'plan', plan_id)
+    else:
+        bump_data_version(instance.user_id)
+
+@receiver(pre_save, sender=Transaction)
+def remember_rolled_up_transaction(sender, instance, **kwargs):
+    # Keep the stored key and amount so post_save can move the amount between rollup rows
+    instance._rolled_up = None
+    if instance.pk is not None:
+        instance._rolled_up = Transaction.objects.filter(pk=instance.pk).values(*ROLLUP_KEY_FIELDS, 'amount').first()
+
+@receiver(post_save, sender=Transaction)
+def update_daily_totals_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_rolled_up', None)
+    amount = Decimal(str(instance.amount))
+    if previous is not None:
+        if rollup_key(previous) == rollup_key(instance):
+            if previous['amount'] != amount:
+                apply_rollup_delta(rollup_key(instance), amount - previous['amount'], 0)
+            return
+        apply_rollup_delta(rollup_key(previous), -previous['amount'], -1)
+    apply_rollup_delta(rollup_key(instance), amount, 1)
+
+@receiver(post_delete, sender=Transaction)
+def update_daily_totals_on_delete(sender, instance, **kwargs):
+    if is_being_deleted(instance.user_id):
+        return
+    apply_rollup_delta(rollup_key(instance), -Decimal(str(instance.amount)), -1)
+
+@receiver(post_save, sender=Transaction)
+def update_financial_summaries_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_rolled_up', None)
+    amount = Decimal(str(instance.amount))
+    if previous is not None:
+        if rollup_key(previous) == rollup_key(instance) and previous['amount'] == amount:
+            return
+        apply_summary_delta(previous['user_id'], previous['status'], -previous['amount'], previous['currency'],
+                            previous['date'])
+    apply_summary_delta(instance.user_id, instance.status, amount, instance.currency, instance.date)
+
+@receiver(post_delete, sender=Transaction)
+def update_financial_summaries_on_delete(sender, instance, **kwargs):
+    if is_being_deleted(instance.user_id):
+        return
+    apply_summary_delta(instance.user_id, instance.status, -Decimal(str(instance.amount)), instance.currency,
+                        instance.date)
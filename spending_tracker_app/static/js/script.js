@@ -2,6 +2,9 @@
 let transactions = []; // Single declaration to avoid SyntaxError
 let categories = [];
 let plans = [];
+let nextTransactionsCursor = null; // Cursor of the next page of transactions, null on the last page
+let transactionTotals = null; // Server-side totals of the whole filtered history
+let dataVersion = null; // Data version the local lists are known to be current for, see syncChanges()
 
 // Helper function to get CSRF token for Django
 function getCookie(name) {
@@ -40,6 +43,16 @@ document.addEventListener("DOMContentLoaded", () => {
             };
         });
         console.log("Initialized transactions from server-rendered table:", transactions);
+
+        nextTransactionsCursor = table.dataset.nextCursor || null;
+        const totalsDiv = document.getElementById("totals");
+        if (totalsDiv && totalsDiv.dataset.totalEarned !== undefined) {
+            transactionTotals = {
+                earned: parseFloat(totalsDiv.dataset.totalEarned) || 0,
+                spent: parseFloat(totalsDiv.dataset.totalSpent) || 0
+            };
+        }
+        updateTotals();
     }
 
     const currentPath = window.location.pathname;
@@ -50,6 +63,17 @@ document.addEventListener("DOMContentLoaded", () => {
         fetchCategories().then(() => updateCategoryTable(categories));
     }
 
+    // Pick up edits made in other tabs or devices when the page becomes visible again
+    document.addEventListener("visibilitychange", () => {
+        if (document.visibilityState === "visible") syncChanges();
+    });
+
+    // Generate reports in the background instead of holding the request open
+    const reportForm = document.getElementById("reportForm");
+    if (reportForm) {
+        reportForm.addEventListener("submit", generateReport);
+    }
+
     // Prevent default form submission for category form
     const categoryForm = document.getElementById("categoryForm");
     if (categoryForm) {
@@ -100,22 +124,113 @@ function checkPlanButtons() {
     }
 }
 
-// Fetch transactions with server-side conversion (only for dashboard page updates)
-function fetchTransactions() {
-    const table = document.getElementById("expenseTable");
-    if (!table) {
-        console.warn("Expense table not found, skipping transaction fetch");
-        return;
-    }
-
+// Query string with the current dashboard filters (optionally for the page after cursor)
+function transactionFilterQuery(cursor = null) {
     const status = document.getElementById('filterStatus')?.value || 'all';
     const category = document.getElementById('filterCategory')?.value || '';
     const startDate = document.getElementById('startDate')?.value || '';
     const endDate = document.getElementById('endDate')?.value || '';
     const displayCurrency = document.getElementById('displayCurrency')?.value || 'QAR';
-    const url = `/get_transactions/?status=${encodeURIComponent(status)}&category=${encodeURIComponent(category)}&start_date=${encodeURIComponent(startDate)}&end_date=${encodeURIComponent(endDate)}&display_currency=${encodeURIComponent(displayCurrency)}`;
+    let query = `status=${encodeURIComponent(status)}&category=${encodeURIComponent(category)}&start_date=${encodeURIComponent(startDate)}&end_date=${encodeURIComponent(endDate)}&display_currency=${encodeURIComponent(displayCurrency)}&format=columnar`;
+    if (cursor) query += `&cursor=${encodeURIComponent(cursor)}`;
+    return query;
+}
+
+// Turn a columnar transactions payload (parallel arrays, dictionary-encoded status and category) back into rows
+function decodeTransactions(payload) {
+    if (!payload) return [];
+    if (Array.isArray(payload)) return payload; // Row format
+    const rows = new Array(payload.count);
+    for (let i = 0; i < payload.count; i++) {
+        rows[i] = {
+            id: payload.id[i],
+            date: payload.date[i],
+            status: payload.status.values[payload.status.codes[i]],
+            category__name: payload.category__name.values[payload.category__name.codes[i]],
+            amount: payload.amount[i],
+            currency: payload.currency,
+            description: payload.description[i]
+        };
+    }
+    return rows;
+}
+
+// Remember the paging state and totals from a transaction page response
+function applyTransactionPage(data) {
+    nextTransactionsCursor = data.next_cursor || null;
+    if (data.totals) transactionTotals = data.totals;
+    const loadMoreBtn = document.getElementById("loadMoreTransactions");
+    if (loadMoreBtn) loadMoreBtn.style.display = nextTransactionsCursor ? "" : "none";
+}
+
+// Remember the version of the first full list loaded; syncChanges() moves it forward from there
+function rememberDataVersion(data) {
+    if (dataVersion === null && data && data.version !== undefined) dataVersion = data.version;
+}
+
+// Replace the item with the same id in list, or append it
+function upsertById(list, item) {
+    const index = list.findIndex(existing => Number(existing.id) === Number(item.id));
+    if (index === -1) return list.concat([item]);
+    const updated = list.slice();
+    updated[index] = item;
+    return updated;
+}
+
+// Drop the items whose id is in ids (a single id or an array of ids)
+function removeById(list, ids) {
+    const removed = new Set([].concat(ids).map(Number));
+    return list.filter(item => !removed.has(Number(item.id)));
+}
+
+// Fetch only what changed since dataVersion and merge it into the loaded lists
+function syncChanges() {
+    if (dataVersion === null) return Promise.resolve();
+    const displayCurrency = document.getElementById('displayCurrency')?.value || 'QAR';
+
+    return fetch(`/changes/?since=${dataVersion}&display_currency=${encodeURIComponent(displayCurrency)}`, {
+        method: 'GET',
+        headers: { 'X-CSRFToken': getCookie('csrftoken') }
+    })
+    .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status} - ${response.statusText}`);
+        return response.json();
+    })
+    .then(data => {
+        dataVersion = data.version;
+        const categoryChanges = data.categories;
+        if (categoryChanges.upserted.length || categoryChanges.deleted.length) {
+            categoryChanges.upserted.forEach(category => { categories = upsertById(categories, category); });
+            categories = removeById(categories, categoryChanges.deleted);
+            if (document.getElementById("category")) populateCategoryDropdown("category");
+            if (document.getElementById("editCategory")) populateCategoryDropdown("editCategory");
+            if (document.getElementById("filterCategory")) populateFilterCategoryDropdown();
+            if (document.getElementById("categoryTable")) updateCategoryTable(categories);
+        }
+        const planChanges = data.plans;
+        if (planChanges.upserted.length || planChanges.deleted.length) {
+            planChanges.upserted.forEach(plan => { plans = upsertById(plans, plan); });
+            plans = removeById(plans, planChanges.deleted);
+            if (document.getElementById("planTable")) updatePlanTable();
+            updatePlanStatus();
+        }
+        // Filters and paging decide which transactions are on screen, so reload the first page
+        const transactionChanges = data.transactions;
+        if (transactionChanges.upserted.length || transactionChanges.deleted.length) fetchTransactions();
+        console.log(`Synced changes up to version ${dataVersion}`);
+    })
+    .catch(error => console.error('Error syncing changes:', error.message || error));
+}
+
+// Fetch the first page of transactions with server-side conversion (only for dashboard page updates)
+function fetchTransactions() {
+    const table = document.getElementById("expenseTable");
+    if (!table) {
+        console.warn("Expense table not found, skipping transaction fetch");
+        return Promise.resolve();
+    }
 
-    fetch(url, {
+    return fetch(`/get_transactions/?${transactionFilterQuery()}`, {
         method: 'GET',
         headers: { 'X-CSRFToken': getCookie('csrftoken') }
     })
@@ -124,7 +239,9 @@ function fetchTransactions() {
         return response.json();
     })
     .then(data => {
-        transactions = data.transactions || [];
+        transactions = decodeTransactions(data.transactions);
+        applyTransactionPage(data);
+        rememberDataVersion(data);
         updateTable(transactions);
         updateTotals();
         showSummary();
@@ -137,6 +254,52 @@ function fetchTransactions() {
     });
 }
 
+// Re-read the server-side totals without reloading the table (only for dashboard page)
+function refreshTransactionTotals() {
+    return fetch(`/get_transactions/?${transactionFilterQuery()}&limit=1`, {
+        method: 'GET',
+        headers: { 'X-CSRFToken': getCookie('csrftoken') }
+    })
+    .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status} - ${response.statusText}`);
+        return response.json();
+    })
+    .then(data => {
+        if (data.totals) transactionTotals = data.totals;
+        updateTotals();
+        showSummary();
+        updatePlanStatus();
+    })
+    .catch(error => console.error('Error refreshing totals:', error.message || error));
+}
+
+// Load the next page of transactions and append it to the table (only for dashboard page)
+function loadMoreTransactions() {
+    const table = document.getElementById("expenseTable");
+    if (!table || !nextTransactionsCursor) return;
+
+    fetch(`/get_transactions/?${transactionFilterQuery(nextTransactionsCursor)}`, {
+        method: 'GET',
+        headers: { 'X-CSRFToken': getCookie('csrftoken') }
+    })
+    .then(response => {
+        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status} - ${response.statusText}`);
+        return response.json();
+    })
+    .then(data => {
+        const page = decodeTransactions(data.transactions);
+        transactions = transactions.concat(page);
+        applyTransactionPage(data);
+        const tbody = table.querySelector("tbody");
+        page.forEach(t => appendTransactionRow(tbody, t));
+        console.log(`Loaded ${page.length} more transactions`);
+    })
+    .catch(error => {
+        console.error('Error loading more transactions:', error.message || error);
+        showMessageModal("Failed to load more transactions. Check console for details.", true);
+    });
+}
+
 // Fetch categories (only for dashboard page)
 function fetchCategories() {
     const categorySelect = document.getElementById("category");
@@ -157,6 +320,7 @@ function fetchCategories() {
     })
     .then(data => {
         categories = data.categories.map(cat => ({ id: cat.id, name: cat.name }));
+        rememberDataVersion(data);
         if (categorySelect) populateCategoryDropdown("category");
         if (editCategorySelect) populateCategoryDropdown("editCategory");
         if (filterCategorySelect) populateFilterCategoryDropdown();
@@ -188,6 +352,7 @@ function fetchPlans() {
     })
     .then(data => {
         plans = data.plans || [];
+        rememberDataVersion(data);
         updatePlanTable();
         updatePlanStatus();
         console.log("Plans fetched:", plans);
@@ -327,8 +492,8 @@ function addCategory(event) {
             // Optionally reopen modal or revert UI
             openCategoryForm(); // Reopen modal on error
         } else {
-            // Update categories without redeclaring (use assignment)
-            categories = data.categories || [];
+            // Merge the new category without redeclaring (use assignment)
+            categories = upsertById(categories, data.category);
             // Update category dropdowns and table immediately
             populateCategoryDropdown("category");
             populateCategoryDropdown("editCategory");
@@ -457,7 +622,7 @@ function deleteCategory() {
             showMessageModal(`Error: ${data.error}`, true);
             confirmDeleteCategory(categoryId); // Reopen confirmation on error
         } else {
-            categories = data.categories || [];
+            categories = removeById(categories, data.deleted);
             updateCategoryTable(categories);
             showMessageModal("Category and associated spendings deleted successfully!", false);
         }
@@ -535,7 +700,7 @@ function updateCategory() {
             }
             editCategory(categoryId, categoryName); // Reopen edit form on error
         } else {
-            categories = data.categories || [];
+            categories = upsertById(categories, data.category);
             updateCategoryTable(categories);
             populateCategoryDropdown("category");
             populateCategoryDropdown("editCategory");
@@ -693,11 +858,9 @@ function deleteTransaction(button, transactionId) {
                     document.getElementById("overlay").style.display = "none";
                 };
             } else {
-                transactions = data.transactions || [];
+                transactions = removeById(transactions, data.deleted);
                 updateTable(transactions);
-                updateTotals();
-                showSummary();
-                updatePlanStatus();
+                refreshTransactionTotals();
                 showMessageModal("Transaction deleted successfully.", false);
                 const successModal = document.getElementById("deleteSuccessModal");
                 const successOkBtn = document.getElementById("deleteSuccessOk");
@@ -801,24 +964,27 @@ function updateTable(transactionsData) {
         return;
     }
     tbody.innerHTML = "";
-    transactionsData.forEach(t => {
-        const row = tbody.insertRow();
-        row.innerHTML = `
-            <td>${t.date || ''}</td>
-            <td class="${t.status || 'spent'}">${(t.status || 'Spent').charAt(0).toUpperCase() + (t.status || 'Spent').slice(1)}</td>
-            <td>${t.category__name || t.category || 'undefined'}</td>
-            <td>${t.amount || 0}</td>
-            <td>${t.currency || 'QAR'}</td>
-            <td>${t.description || ''}</td>
-            <td>
-                <button onclick="editTransaction(this, ${t.id || 0})" style="background-color: #ff4444;">Edit</button>
-                <button onclick="deleteTransaction(this, ${t.id || 0})" style="background-color: #ff4444;">Delete</button>
-            </td>
-        `;
-    });
+    transactionsData.forEach(t => appendTransactionRow(tbody, t));
     updateTotals();
 }
 
+// Append one transaction row to the table body
+function appendTransactionRow(tbody, t) {
+    const row = tbody.insertRow();
+    row.innerHTML = `
+        <td>${t.date || ''}</td>
+        <td class="${t.status || 'spent'}">${(t.status || 'Spent').charAt(0).toUpperCase() + (t.status || 'Spent').slice(1)}</td>
+        <td>${t.category__name || t.category || 'undefined'}</td>
+        <td>${t.amount || 0}</td>
+        <td>${t.currency || 'QAR'}</td>
+        <td>${t.description || ''}</td>
+        <td>
+            <button onclick="editTransaction(this, ${t.id || 0})" style="background-color: #ff4444;">Edit</button>
+            <button onclick="deleteTransaction(this, ${t.id || 0})" style="background-color: #ff4444;">Delete</button>
+        </td>
+    `;
+}
+
 // Update totals (only for dashboard page)
 function updateTotals() {
     const table = document.getElementById("expenseTable");
@@ -831,14 +997,20 @@ function updateTotals() {
     let totalSpent = 0;
     const displayCurrency = document.getElementById("displayCurrency")?.value || "QAR";
 
-    rows.forEach(row => {
-        if (row.style.display !== "none") {
-            const amount = parseFloat(row.cells[3].textContent) || 0;
-            const status = row.cells[1].textContent.toLowerCase();
-            if (status === "earned") totalEarned += amount;
-            else if (status === "spent") totalSpent += amount;
-        }
-    });
+    if (transactionTotals) {
+        // The table may hold only the first pages, so use the server's totals for the whole history
+        totalEarned = transactionTotals.earned || 0;
+        totalSpent = transactionTotals.spent || 0;
+    } else {
+        rows.forEach(row => {
+            if (row.style.display !== "none") {
+                const amount = parseFloat(row.cells[3].textContent) || 0;
+                const status = row.cells[1].textContent.toLowerCase();
+                if (status === "earned") totalEarned += amount;
+                else if (status === "spent") totalSpent += amount;
+            }
+        });
+    }
 
     const totalEarnedElement = document.getElementById("totalEarned");
     const totalSpentElement = document.getElementById("totalSpent");
@@ -1047,7 +1219,7 @@ function updatePlan() {
             alert(`Error: ${data.error}`);
             return;
         }
-        plans = data.plans;
+        plans = upsertById(plans, data.plan);
         updatePlanTable();
         closeEditPlanForm();
         updatePlanStatus();
@@ -1088,7 +1260,7 @@ function deletePlan(planId) {
                 alert(`Error: ${data.error}`);
                 return;
             }
-            plans = data.plans;
+            plans = removeById(plans, data.deleted);
             updatePlanTable();
             updatePlanStatus();
         })
@@ -1121,80 +1293,39 @@ function addToPlans(category, amount) {
     });
 }
 
-// Generate report (only for dashboard page)
-function generateReport() {
-    const startDate = document.getElementById("startDate")?.value;
-    const endDate = document.getElementById("endDate")?.value;
-    const table = document.getElementById("expenseTable");
-    if (!table) {
-        console.error("Expense table not found");
-        return;
-    }
-    const rows = table.querySelectorAll("tbody tr");
-    const reportData = [];
-
-    rows.forEach(row => {
-        if (row.style.display !== "none") {
-            reportData.push({
-                Date: row.cells[0].textContent,
-                Status: row.cells[1].textContent,
-                Category: row.cells[2].textContent,
-                Amount: row.cells[3].textContent,
-                Currency: row.cells[4].textContent,
-                Description: row.cells[5].textContent
-            });
+// Queues a report job, polls its progress and starts the download once the file is ready
+async function generateReport(event) {
+    event.preventDefault();
+    const form = event.target;
+    const formData = new FormData(form);
+    formData.append('async', '1');
+    closeReportModal();
+    showMessageModal("Generating report...", false);
+    try {
+        const response = await fetch(form.action, {
+            method: 'POST',
+            body: formData,
+            headers: { 'X-CSRFToken': getCookie('csrftoken') }
+        });
+        let job = await response.json();
+        if (!response.ok) throw new Error(job.error || `HTTP ${response.status}`);
+        const statusUrl = job.status_url;
+        while (job.status === 'pending' || job.status === 'running') {
+            if (job.rows_total) {
+                showMessageModal(`Generating report... ${job.rows_processed} of ${job.rows_total} rows`, false);
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const statusResponse = await fetch(statusUrl);
+            job = await statusResponse.json();
+            if (!statusResponse.ok) throw new Error(job.error || `HTTP ${statusResponse.status}`);
         }
-    });
-
-    if (reportData.length === 0) {
-        alert("No visible data to generate a report!");
-        return;
-    }
-
-    const reportModal = document.getElementById("reportModal");
-    if (!reportModal) {
-        console.error("Report modal not found");
-        return;
+        if (job.status !== 'done') throw new Error(job.error || 'Report generation failed');
+        closeMessageModal();
+        window.location.href = job.download_url;
+    } catch (error) {
+        console.error("Error generating report:", error);
+        showMessageModal(`Failed to generate report: ${error.message}`, true);
     }
-    const filename = document.getElementById("reportFilename").value || "report";
-    const format = document.getElementById("reportFormat").value || "excel";
-
-    fetch('/generate_report/', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'X-CSRFToken': getCookie('csrftoken'),
-            'X-Requested-With': 'XMLHttpRequest'
-        },
-        body: JSON.stringify({
-            start_date: startDate,
-            end_date: endDate,
-            status: document.getElementById("filterStatus")?.value || "all",
-            category: document.getElementById("filterCategory")?.value || "",
-            format: format,
-            filename: filename,
-            display_currency: document.getElementById("displayCurrency")?.value || "QAR"
-        })
-    })
-    .then(response => {
-        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
-        return response.blob();
-    })
-    .then(blob => {
-        const url = window.URL.createObjectURL(blob);
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `${filename}.${format}`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        window.URL.revokeObjectURL(url);
-        closeReportModal();
-    })
-    .catch(error => {
-        console.error('Error generating report:', error.message || error);
-        alert("Failed to generate report. Check console for details.");
-    });
 }
 
 // Function to show modal message
@@ -1365,9 +1496,7 @@ function updateTransaction() {
             const updatedTransaction = data.transaction || { id: parseInt(transactionId), amount, currency, status, category, date, description };
             transactions = transactions.map(t => t.id === parseInt(transactionId) ? updatedTransaction : t);
             updateTable(transactions);
-            updateTotals();
-            showSummary();
-            updatePlanStatus();
+            refreshTransactionTotals();
             showMessageModal("Transaction updated successfully!", false);
         }
     })
@@ -1514,11 +1643,9 @@ function deleteTransaction(button, transactionId) {
                     document.getElementById("overlay").style.display = "none";
                 };
             } else {
-                transactions = data.transactions || [];
+                transactions = removeById(transactions, data.deleted);
                 updateTable(transactions);
-                updateTotals();
-                showSummary();
-                updatePlanStatus();
+                refreshTransactionTotals();
                 showMessageModal("Transaction deleted successfully.", false);
                 const successModal = document.getElementById("deleteSuccessModal");
                 const successOkBtn = document.getElementById("deleteSuccessOk");
@@ -1810,7 +1937,7 @@ function updatePlan() {
             alert(`Error: ${data.error}`);
             return;
         }
-        plans = data.plans;
+        plans = upsertById(plans, data.plan);
         updatePlanTable();
         closeEditPlanForm();
         updatePlanStatus();
@@ -1851,7 +1978,7 @@ function deletePlan(planId) {
                 alert(`Error: ${data.error}`);
                 return;
             }
-            plans = data.plans;
+            plans = removeById(plans, data.deleted);
             updatePlanTable();
             updatePlanStatus();
         })
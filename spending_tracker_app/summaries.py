@@ -0,0 +1,55 @@
+import datetime
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DailyCategoryTotal, UserFinancialSummary
+from .exchange_rates import convert_currency, convert_totals, get_rates_version
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = {'earned': 'total_earned', 'spent': 'total_spent'}
+
+
+def get_financial_summary(user, currency):
+    """
+    Returns the user's UserFinancialSummary in currency, computing it from the daily totals
+    the first time that currency is asked for and again whenever it was converted under an
+    older rates version. Other reads are a single row lookup.
+    """
+    rates_version = get_rates_version()
+    summary = UserFinancialSummary.objects.filter(user=user, currency=currency).first()
+    if summary is not None and summary.rates_version == rates_version:
+        return summary
+    totals = convert_totals(DailyCategoryTotal.objects.filter(user=user), currency)
+    if summary is not None:
+        # Skipped if a concurrent request already recomputed it
+        UserFinancialSummary.objects.filter(id=summary.id, rates_version=summary.rates_version).update(
+            total_earned=totals['earned'], total_spent=totals['spent'], rates_version=rates_version,
+            updated_at=timezone.now())
+        summary.total_earned, summary.total_spent = totals['earned'], totals['spent']
+        summary.rates_version = rates_version
+        return summary
+    try:
+        with transaction.atomic():
+            return UserFinancialSummary.objects.create(
+                user=user, currency=currency, total_earned=totals['earned'], total_spent=totals['spent'],
+                rates_version=rates_version)
+    except IntegrityError:  # Created by a concurrent request
+        return UserFinancialSummary.objects.get(user=user, currency=currency)
+
+
+def apply_summary_delta(user_id, status, amount, currency, date):
+    """
+    Adds amount (negative to remove a transaction) to every stored summary of the user,
+    converted to each summary's currency at the transaction date's rate.
+    """
+    field = SUMMARY_FIELDS.get(status)
+    if field is None:
+        return
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    get_rates_version()  # Resets this process's rate caches if newer snapshots were stored elsewhere
+    for summary_id, summary_currency in UserFinancialSummary.objects.filter(user_id=user_id).values_list('id', 'currency'):
+        converted = convert_currency(amount, currency, summary_currency, date)
+        UserFinancialSummary.objects.filter(id=summary_id).update(**{field: F(field) + converted})
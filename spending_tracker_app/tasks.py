@@ -1,8 +1,17 @@
 from celery import shared_task
 from django.contrib.auth.models import User
-from spending_tracker_app.models import UserProfile
+from spending_tracker_app.models import UserProfile, Plan
+from spending_tracker_app.exchange_rates import fetch_rate_table, store_rate_table, seed_exchange_rates, PIVOT_CURRENCY
+from spending_tracker_app.versioning import record_changes
+from spending_tracker_app.reconciliation import reconcile_plan_balances as reconcile_balances
+from spending_tracker_app.reports import run_report_job, delete_expired_reports
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
+import datetime
 import logging
+import requests
 
 logger = logging.getLogger(__name__)
 
@@ -16,4 +25,73 @@ def cleanup_unverified_users():
     for profile in unverified_profiles:
         user = profile.user
         logger.debug(f"Deleting unverified user {user.username} due to expired token")
-        user.delete()
\ No newline at end of file
+        user.delete()
+
+@shared_task
+def refresh_exchange_rates():
+    """
+    Fetches the latest pivot-currency rate table and stores it as today's ExchangeRate
+    snapshot. Every other pair is crossed from it, so this is one provider call per run.
+    Request workers only read those snapshots.
+    """
+    seed_exchange_rates()
+    try:
+        rates = fetch_rate_table(PIVOT_CURRENCY)
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Failed to refresh exchange rates for {PIVOT_CURRENCY}: {str(e)}")
+        return
+    store_rate_table(PIVOT_CURRENCY, rates)
+    logger.debug(f"Stored {len(rates)} exchange rates for {PIVOT_CURRENCY}")
+
+@shared_task
+def advance_plan_statuses(chunk_size=None):
+    """
+    Stores the status of every plan whose stored status no longer matches its dates and
+    left money (e.g. flips expired plans to Completed or Failed), across all users.
+    Each chunk of plans is moved with one conditional UPDATE, and the owners' data
+    versions are bumped so clients pick the new statuses up.
+    Returns the number of plans updated.
+    """
+    chunk_size = chunk_size or getattr(settings, 'PLAN_STATUS_CHUNK_SIZE', 1000)
+    today = datetime.date.today()
+    stale = Plan.objects.annotate(current_status=Plan.status_expression(today)).exclude(
+        status=F('current_status')).order_by('id').values_list('id', 'user_id')
+    updated = 0
+    last_id = 0
+    while True:
+        chunk = list(stale.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        plan_ids_by_user = {}
+        for plan_id, user_id in chunk:
+            plan_ids_by_user.setdefault(user_id, []).append(plan_id)
+        with transaction.atomic():
+            updated += Plan.objects.filter(id__in=[plan_id for plan_id, _ in chunk]).update(
+                status=Plan.status_expression(today))
+            for user_id, plan_ids in plan_ids_by_user.items():
+                record_changes(user_id, 'plan', plan_ids)
+    logger.debug(f"Advanced the status of {updated} plans")
+    return updated
+
+@shared_task
+def reconcile_plan_balances():
+    """
+    Recomputes every plan's left_money from the transactions ledger and fixes drifted plans.
+    Returns the drift statistics with amounts as strings so they serialize as a task result.
+    """
+    stats = reconcile_balances()
+    if stats['drifted']:
+        logger.warning(f"Fixed {stats['drifted']} drifted plan balances of {stats['users']} users "
+                       f"(total drift {stats['total_drift']}, largest {stats['max_drift']})")
+    return {key: str(value) for key, value in stats.items()}
+
+@shared_task
+def generate_report_job(job_id):
+    """Writes the report of a ReportJob queued by generate_report. Returns the job's final status."""
+    return run_report_job(job_id).status
+
+@shared_task
+def cleanup_expired_reports():
+    deleted = delete_expired_reports()
+    logger.debug(f"Deleted {deleted} expired reports")
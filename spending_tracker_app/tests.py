@@ -1,3 +1,1200 @@
-from django.test import TestCase
+import datetime
+import json
+import threading
+import time
+import shutil
+import tempfile
+import uuid
+from unittest import mock
+from collections import Counter
+from decimal import Decimal
+import numpy as np
+import openpyxl
+import requests
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from io import BytesIO
+from django.db.models import Count, Sum
+from django.core.cache import cache
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from .analytics import EPOCH_ORDINAL, compute_spending_analytics, get_spending_analytics, load_spending_arrays
+from .tasks import advance_plan_statuses, cleanup_expired_reports, refresh_exchange_rates
+from .http_client import ProviderClient, CircuitBreaker, CircuitOpenError, build_session
+from .exchange_rates import (fetch_rate_table, store_rate_table, rate_table_cache, historical_rate_index,
+                             RateTableCache, HistoricalRateIndex, HARD_CODED_RATES, RATE_PRECISION, cross_rate,
+                             convert_many, get_exchange_rate, get_rates_version, seed_exchange_rates,
+                             PIVOT_CURRENCY, HARD_CODED_RATES_DATE, RATES_VERSION_CACHE_KEY)
+from .models import (Category, Transaction, Plan, ChangeLogEntry, DailyCategoryTotal, ReportJob, UserFinancialSummary,
+                     ExchangeRate)
+from .rollups import rebuild_daily_totals
+from .reconciliation import reconcile_plan_balances
+from .summaries import get_financial_summary
+from .versioning import get_data_version
+from .views import convert_currency, convert_totals, chart_data, downsample_lttb, deduct_from_plans, add_to_plans
 
-# Create your tests here.
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answers like exchangerate-api.com, or with the status codes queued in server.failures."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.failures:
+            self.send_response(self.server.failures.pop(0))
+            self.end_headers()
+            return
+        body = json.dumps({'result': 'success', 'conversion_rates': {'USD': 1, 'QAR': 3.641}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProviderClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubProviderHandler)
+        self.server.requests = []
+        self.server.failures = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = ProviderClient(
+            f"http://127.0.0.1:{self.server.server_port}/v6/key",
+            transport=build_session(),
+            timeout=2, retries=2, backoff=0,
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+        )
+
+    def test_fetch_rate_table_through_stub_server(self):
+        rates = fetch_rate_table('USD', client=self.client)
+        self.assertEqual(rates, {'USD': Decimal('1'), 'QAR': Decimal('3.641')})
+        self.assertEqual(self.server.requests, ['/v6/key/latest/USD'])
+
+    def test_retries_server_errors(self):
+        self.server.failures = [503, 500]
+        self.assertIn('conversion_rates', self.client.get_json('latest/USD'))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.server.failures = [500] * 3
+        with self.assertRaises(Exception):
+            self.client.get_json('latest/USD')
+        self.assertEqual(self.client.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.client.get_json('latest/USD')
+        self.assertEqual(len(self.server.requests), 3)  # The open circuit never reached the server
+
+
+class RefreshExchangeRatesTests(TestCase):
+    """refresh_exchange_rates with ProviderClient.get_json mocked, starting from the seeded snapshot."""
+
+    def setUp(self):
+        rate_table_cache.clear()
+        historical_rate_index.clear()
+        self.addCleanup(rate_table_cache.clear)
+        self.addCleanup(historical_rate_index.clear)
+        seed_exchange_rates()
+        cache.delete(RATES_VERSION_CACHE_KEY)
+        self.assertEqual(get_exchange_rate('USD', 'QAR'), HARD_CODED_RATES['QAR'])  # Fills the rate caches
+        self.version = get_rates_version()
+
+    def test_stores_todays_snapshot_and_resets_the_rate_caches(self):
+        table = {'result': 'success', 'conversion_rates': {'USD': 1, 'QAR': 3.7, 'EUR': 0.95, 'GBP': 0}}
+        with mock.patch.object(ProviderClient, 'get_json', return_value=table) as get_json:
+            refresh_exchange_rates()
+        get_json.assert_called_once_with(f'latest/{PIVOT_CURRENCY}')
+        self.assertEqual(
+            dict(ExchangeRate.objects.filter(base_currency=PIVOT_CURRENCY, date=datetime.date.today())
+                 .values_list('currency', 'rate')),
+            {'USD': Decimal('1'), 'QAR': Decimal('3.7'), 'EUR': Decimal('0.95')})
+        self.assertEqual(get_exchange_rate('USD', 'QAR'), Decimal('3.7'))
+        self.assertNotEqual(get_rates_version(), self.version)
+
+    def test_failures_keep_the_stored_snapshots(self):
+        with mock.patch.object(ProviderClient, 'get_json', side_effect=requests.ConnectionError('provider down')):
+            refresh_exchange_rates()
+        with mock.patch.object(ProviderClient, 'get_json', return_value={'result': 'error', 'error': 'invalid-key'}):
+            refresh_exchange_rates()
+        self.assertEqual(set(ExchangeRate.objects.values_list('date', flat=True)), {HARD_CODED_RATES_DATE})
+        self.assertEqual(get_exchange_rate('USD', 'QAR'), HARD_CODED_RATES['QAR'])
+        self.assertEqual(get_rates_version(), self.version)
+
+
+class RateTableCacheTests(SimpleTestCase):
+    """RateTableCache against a stub fetcher, with time.monotonic under the test's control."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('spending_tracker_app.exchange_rates.time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.fetches = 0
+        self.failing = False
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.cache = RateTableCache(fetcher=self.fetch, ttl=60, retry_after=30)
+
+    def fetch(self, base_currency):
+        self.fetches += 1
+        self.started.set()
+        self.release.wait()
+        if self.failing:
+            raise ValueError("provider down")
+        return {'QAR': Decimal(self.fetches)}
+
+    def test_table_is_reused_until_ttl_expires(self):
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(1)})
+        self.now += 59
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(1)})
+        self.assertEqual(self.fetches, 1)
+        self.now += 2
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(2)})
+        self.assertEqual(self.fetches, 2)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        self.release.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_rates('USD'))) for _ in range(5)]
+        threads[0].start()
+        self.assertTrue(self.started.wait(2))
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)  # Let the other callers reach the in-flight fetch
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(results, [{'QAR': Decimal(1)}] * 5)
+
+    def test_stale_table_is_served_while_one_caller_refreshes(self):
+        self.cache.get_rates('USD')
+        self.now += 61
+        self.release.clear()
+        self.started.clear()
+        refreshed = []
+        leader = threading.Thread(target=lambda: refreshed.append(self.cache.get_rates('USD')))
+        leader.start()
+        self.assertTrue(self.started.wait(2))
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(1)})  # Does not wait on the refresh
+        self.release.set()
+        leader.join(2)
+        self.assertEqual(refreshed, [{'QAR': Decimal(2)}])
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(2)})
+        self.assertEqual(self.fetches, 2)
+
+    def test_failed_fetch_is_not_retried_until_retry_after(self):
+        self.cache.get_rates('USD')
+        self.now += 61
+        self.failing = True
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(1)})  # The stale table outlives the failure
+        self.now += 29
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(1)})
+        self.assertEqual(self.fetches, 2)
+        self.now += 2
+        self.failing = False
+        self.assertEqual(self.cache.get_rates('USD'), {'QAR': Decimal(3)})
+        self.assertEqual(self.fetches, 3)
+
+    def test_failed_first_fetch_returns_none(self):
+        self.failing = True
+        self.assertIsNone(self.cache.get_rates('USD'))
+        self.assertIsNone(self.cache.get_rates('USD'))
+        self.assertEqual(self.fetches, 1)
+
+
+class RatesTestCase(TestCase):
+    """Stores a small pivot rate history and resets the process-wide rate caches around each test."""
+
+    def setUp(self):
+        rate_table_cache.clear()
+        historical_rate_index.clear()
+        self.addCleanup(rate_table_cache.clear)
+        self.addCleanup(historical_rate_index.clear)
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('3.64'), 'EUR': Decimal('0.9')},
+                         date=datetime.date(2025, 1, 1))
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('3.7'), 'EUR': Decimal('0.95')},
+                         date=datetime.date(2025, 2, 1))
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.user.userprofile.email_verified = True
+        self.user.userprofile.save()
+        self.food = Category.objects.create(name='Food', user=self.user)
+        self.salary = Category.objects.create(name='Salary', user=self.user)
+
+    def add_transactions(self, count):
+        Transaction.objects.bulk_create([
+            Transaction(
+                user=self.user,
+                date=datetime.date(2025, 1 + i % 2, 1 + i % 28),
+                status='earned' if i % 4 == 0 else 'spent',
+                category=self.salary if i % 4 == 0 else self.food,
+                amount=Decimal('12.35') + i,
+                currency=['QAR', 'USD', 'EUR'][i % 3],
+                description=f'Transaction {i}',
+            )
+            for i in range(count)
+        ])
+        rebuild_daily_totals(self.user)  # bulk_create skips the signals that maintain the rollup
+
+
+class CrossRateTests(RatesTestCase):
+    def test_non_pivot_pair_is_crossed_through_the_pivot(self):
+        self.assertEqual(get_exchange_rate('QAR', 'EUR'), (Decimal('0.95') / Decimal('3.7')).quantize(RATE_PRECISION))
+        self.assertEqual(convert_many([(Decimal('100'), 'QAR', datetime.date(2025, 1, 15))], 'EUR'),
+                         [Decimal('100') * (Decimal('0.9') / Decimal('3.64')).quantize(RATE_PRECISION)])
+
+    def test_reciprocal_pairs(self):
+        for from_currency, to_currency in [('USD', 'QAR'), ('QAR', 'EUR')]:
+            there = get_exchange_rate(from_currency, to_currency)
+            back = get_exchange_rate(to_currency, from_currency)
+            self.assertAlmostEqual(there * back, Decimal('1'), places=8)
+        self.assertEqual(get_exchange_rate('QAR', 'QAR'), Decimal('1'))
+
+    def test_hard_coded_rates_without_snapshots(self):
+        ExchangeRate.objects.all().delete()
+        rate_table_cache.clear()
+        historical_rate_index.clear()
+        expected = cross_rate(HARD_CODED_RATES['QAR'], HARD_CODED_RATES['EUR'])
+        self.assertEqual(get_exchange_rate('QAR', 'EUR'), expected)
+        self.assertEqual(convert_many([(Decimal('10'), 'QAR', datetime.date(2025, 1, 15))], 'EUR'),
+                         [Decimal('10') * expected])
+        self.assertEqual(get_exchange_rate('XYZ', 'EUR'), Decimal('1'))  # Unknown everywhere
+
+
+class ConvertManyLookupTests(SimpleTestCase):
+    """convert_many looks up each distinct source currency once, however many rows it converts."""
+
+    rates = {'QAR': Decimal('0.25'), 'EUR': Decimal('1'), 'USD': Decimal('0.9')}
+
+    def rows(self):
+        return [(Decimal(i), ['QAR', 'EUR', 'USD'][i % 3]) for i in range(300)]
+
+    def test_each_currency_rate_is_looked_up_once(self):
+        with mock.patch('spending_tracker_app.exchange_rates.get_exchange_rate',
+                        side_effect=lambda from_currency, to_currency: self.rates[from_currency]) as lookup:
+            converted = convert_many(self.rows(), 'EUR')
+        self.assertEqual(sorted(call.args[0] for call in lookup.call_args_list), ['EUR', 'QAR', 'USD'])
+        self.assertEqual(converted, [amount * self.rates[currency] for amount, currency in self.rows()])
+
+
+class HistoricalRateIndexTests(RatesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('spending_tracker_app.exchange_rates.time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def test_old_rows_convert_at_their_own_dates_snapshot(self):
+        converted = convert_many([
+            (Decimal('100'), 'QAR', datetime.date(2024, 12, 1)),  # Before the first snapshot, which applies
+            (Decimal('100'), 'QAR', datetime.date(2025, 1, 15)),
+            (Decimal('100'), 'QAR', datetime.date(2025, 3, 15)),
+        ], 'USD')
+        self.assertEqual(converted, [
+            Decimal('100') * cross_rate(Decimal('3.64'), Decimal('1')),
+            Decimal('100') * cross_rate(Decimal('3.64'), Decimal('1')),
+            Decimal('100') * cross_rate(Decimal('3.7'), Decimal('1')),
+        ])
+
+    def test_dated_rows_load_each_currency_history_once(self):
+        rows = [
+            (Decimal(i), ['QAR', 'EUR', 'USD'][i % 3], datetime.date(2025, 1 + i % 2, 1 + i % 28))
+            for i in range(300)
+        ]
+        with self.assertNumQueries(2):  # QAR and EUR; USD is the pivot
+            self.assertEqual(len(convert_many(rows, 'USD')), 300)
+        with self.assertNumQueries(0):
+            convert_many(rows, 'EUR')
+
+    def test_expired_currency_is_topped_up_from_its_last_day(self):
+        index = HistoricalRateIndex(ttl=60)
+        days = [datetime.date(2025, 1, 15), datetime.date(2025, 2, 15), datetime.date(2025, 3, 15)]
+        self.assertEqual(index.rates_on('QAR', days), [Decimal('3.64'), Decimal('3.7'), Decimal('3.7')])
+        ExchangeRate.objects.filter(currency='QAR', date=datetime.date(2025, 2, 1)).update(rate=Decimal('3.72'))
+        ExchangeRate.objects.create(base_currency='USD', currency='QAR', rate=Decimal('3.8'),
+                                    date=datetime.date(2025, 3, 1))
+        self.assertEqual(index.rates_on('QAR', days), [Decimal('3.64'), Decimal('3.7'), Decimal('3.7')])
+        self.now += 61
+        with mock.patch.object(index, '_load', wraps=index._load) as load:
+            self.assertEqual(index.rates_on('QAR', days), [Decimal('3.64'), Decimal('3.72'), Decimal('3.8')])
+        load.assert_called_once_with('QAR', since=datetime.date(2025, 2, 1))
+
+    def test_least_recently_used_currencies_are_dropped(self):
+        store_rate_table('USD', {'GBP': Decimal('0.8')}, date=datetime.date(2025, 1, 1))
+        index = HistoricalRateIndex(max_currencies=2)
+        day = [datetime.date(2025, 1, 15)]
+        for currency in ['QAR', 'EUR', 'QAR', 'GBP']:
+            index.rates_on(currency, day)
+        self.assertEqual(list(index._series), ['QAR', 'GBP'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(index.rates_on('EUR', day), [Decimal('0.9')])
+        self.assertEqual(len(queries), 1)  # EUR was evicted and is loaded again
+        self.assertEqual(list(index._series), ['GBP', 'EUR'])
+
+
+class ConvertTotalsTests(RatesTestCase):
+    def test_matches_per_row_conversion_with_mixed_currencies(self):
+        self.add_transactions(60)
+        for display_currency in ['QAR', 'USD', 'EUR']:
+            expected = {'earned': Decimal('0'), 'spent': Decimal('0')}
+            for t in Transaction.objects.filter(user=self.user):
+                expected[t.status] += convert_currency(t.amount, t.currency, display_currency, t.date)
+            totals = convert_totals(Transaction.objects.filter(user=self.user), display_currency)
+            self.assertEqual(round(totals['earned'], 2), round(expected['earned'], 2))
+            self.assertEqual(round(totals['spent'], 2), round(expected['spent'], 2))
+
+    def test_profile_totals(self):
+        self.add_transactions(8)
+        self.user.userprofile.preferred_currency = 'USD'
+        self.user.userprofile.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/profile/')
+        expected_spent = sum(
+            convert_currency(t.amount, t.currency, 'USD', t.date)
+            for t in Transaction.objects.filter(user=self.user, status='spent')
+        )
+        self.assertAlmostEqual(response.context['total_spent'], float(expected_spent), places=2)
+
+
+class TransactionPaginationTests(RatesTestCase):
+    def test_pages_walk_every_row_once_when_dates_repeat(self):
+        self.add_transactions(65)  # Only 28 distinct dates, so pages split rows that share a date
+        self.client.force_login(self.user)
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 4, **({'cursor': cursor} if cursor else {})}
+            page = self.client.get('/get_transactions/', params).json()
+            self.assertLessEqual(len(page['transactions']), 4)
+            self.assertEqual('totals' in page, cursor is None)
+            seen.extend(row['id'] for row in page['transactions'])
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        expected = list(Transaction.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 17)
+
+    def test_malformed_cursor_is_rejected(self):
+        self.add_transactions(5)
+        self.client.force_login(self.user)
+        for cursor in ['not-a-cursor', 'MjAyNS0wMS0wMQ', 'MjAyNS0xMy0wMXw1']:  # garbage, no id, bad month
+            response = self.client.get('/get_transactions/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Invalid cursor', response.json()['error'])
+
+    def test_limit_is_capped(self):
+        self.add_transactions(520)
+        self.client.force_login(self.user)
+        page = self.client.get('/get_transactions/', {'limit': 100000}).json()
+        self.assertEqual(len(page['transactions']), 500)
+        self.assertIsNotNone(page['next_cursor'])
+        self.assertEqual(len(self.client.get('/get_transactions/', {'limit': 0}).json()['transactions']), 1)
+        self.assertEqual(len(self.client.get('/get_transactions/', {'limit': 'many'}).json()['transactions']), 50)
+
+
+class QueryBudgetTests(RatesTestCase):
+    """The number of queries a view runs must not grow with the number of transactions."""
+
+    def count_queries(self, method, url, data=None):
+        rate_table_cache.clear()
+        historical_rate_index.clear()
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_flat_query_count(self, method, url, data=None):
+        self.client.force_login(self.user)
+        self.add_transactions(5)
+        few = self.count_queries(method, url, data)
+        self.add_transactions(60)
+        many = self.count_queries(method, url, data)
+        self.assertEqual(few, many)
+
+    def test_index(self):
+        self.assert_flat_query_count('get', '/home/')
+
+    def test_charts(self):
+        self.assert_flat_query_count('get', '/charts/')
+
+    def test_generate_report_excel(self):
+        self.assert_flat_query_count('post', '/generate_report/', {'format': 'excel'})
+
+    def test_generate_report_pdf(self):
+        self.assert_flat_query_count('post', '/generate_report/', {'format': 'pdf'})
+
+
+class DataVersionTests(RatesTestCase):
+    def test_changes_bump_the_version(self):
+        version = get_data_version(self.user)
+        transaction = Transaction.objects.create(
+            user=self.user, date=datetime.date(2025, 1, 5), status='spent', category=self.food,
+            amount=Decimal('10'), currency='USD', description='Lunch')
+        self.assertGreater(get_data_version(self.user), version)
+        version = get_data_version(self.user)
+        transaction.delete()
+        self.assertGreater(get_data_version(self.user), version)
+        version = get_data_version(self.user)
+        plan = Plan.objects.create(user=self.user, type='custom', amount=Decimal('100'), description='Trip',
+                                   from_date=datetime.date(2025, 1, 1), to_date=datetime.date(2099, 1, 1))
+        plan.categories.set([self.food])
+        self.assertGreater(get_data_version(self.user), version)
+        version = get_data_version(self.user)
+        plan.update_status()  # Still active, so nothing is written
+        self.assertEqual(get_data_version(self.user), version)
+
+    def test_unchanged_endpoints_answer_304_without_reading_data_tables(self):
+        self.add_transactions(5)
+        self.client.force_login(self.user)
+        for url in ['/get_categories/', '/get_transactions/?display_currency=USD', '/plans/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            tables = [Transaction._meta.db_table, Category._meta.db_table, Plan._meta.db_table]
+            self.assertFalse([q for q in queries if any(table in q['sql'] for table in tables)])
+
+    def test_etag_changes_after_a_write(self):
+        self.client.force_login(self.user)
+        etag = self.client.get('/get_categories/')['ETag']
+        Category.objects.create(name='Rent', user=self.user)
+        response = self.client.get('/get_categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Rent', [c['name'] for c in response.json()['categories']])
+
+    def test_etag_changes_after_new_rate_snapshots(self):
+        self.add_transactions(5)
+        self.client.force_login(self.user)
+        etag = self.client.get('/get_transactions/', {'display_currency': 'USD'})['ETag']
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('4'), 'EUR': Decimal('1.1')},
+                         date=datetime.date(2025, 1, 1))
+        response = self.client.get('/get_transactions/', {'display_currency': 'USD'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class UserDeletionTests(RatesTestCase):
+    def test_deleting_a_user_cascades_without_logging_changes(self):
+        self.add_transactions(8)
+        Transaction.objects.create(user=self.user, date=datetime.date(2025, 1, 3), status='spent',
+                                   category=self.food, amount=Decimal('4'), currency='QAR')
+        plan = Plan.objects.create(user=self.user, type='custom', amount=Decimal('100'), description='Trip',
+                                   from_date=datetime.date(2025, 1, 1), to_date=datetime.date(2025, 2, 1))
+        plan.categories.set([self.food])
+        get_financial_summary(self.user, 'USD')
+        self.user.delete()
+        self.assertFalse(User.objects.filter(username='alice').exists())
+        for model in (Transaction, Category, Plan, ChangeLogEntry, DailyCategoryTotal, UserFinancialSummary):
+            self.assertFalse(model.objects.exists(), model.__name__)
+
+
+class ChangeFeedTests(RatesTestCase):
+    def post_json(self, url, data=None):
+        return self.client.post(url, json.dumps(data or {}), content_type='application/json',
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_mutations_return_only_the_entity_and_feed_returns_only_changes(self):
+        self.add_transactions(20)
+        self.client.force_login(self.user)
+        since = self.client.get('/get_categories/').json()['version']
+
+        created = self.post_json('/add_category/', {'name': 'rent'}).json()
+        self.assertEqual(set(created), {'category', 'version'})
+        self.assertEqual(created['category']['name'], 'Rent')
+
+        feed = self.client.get('/changes/', {'since': since}).json()
+        self.assertEqual(feed['version'], created['version'])
+        self.assertEqual(feed['categories'], {'upserted': [created['category']], 'deleted': []})
+        self.assertEqual(feed['transactions'], {'upserted': [], 'deleted': []})
+
+        deleted = self.post_json(f"/delete_category/{created['category']['id']}/").json()
+        self.assertEqual(deleted, {'deleted': created['category']['id'], 'version': deleted['version']})
+        feed = self.client.get('/changes/', {'since': feed['version']}).json()
+        self.assertEqual(feed['categories'], {'upserted': [], 'deleted': [created['category']['id']]})
+
+    def test_transaction_and_plan_changes(self):
+        self.client.force_login(self.user)
+        since = self.client.get('/plans/').json()['version']
+        transaction = Transaction.objects.create(
+            user=self.user, date=datetime.date(2025, 1, 5), status='spent', category=self.food,
+            amount=Decimal('10'), currency='USD', description='Lunch')
+        plan = self.post_json('/add_plan/', {'type': 'custom', 'amount': 100, 'description': 'Trip',
+                                             'categories': 'Food', 'from_date': '2025-01-01',
+                                             'to_date': '2099-01-01'}).json()['plan']
+        self.assertEqual(plan['categories'], ['Food'])
+        self.post_json(f'/delete_transaction/{transaction.id}/')
+
+        feed = self.client.get('/changes/', {'since': since, 'display_currency': 'USD'}).json()
+        self.assertEqual(feed['transactions'], {'upserted': [], 'deleted': [transaction.id]})
+        self.assertEqual([p['id'] for p in feed['plans']['upserted']], [plan['id']])
+        self.assertEqual(self.client.get('/changes/', {'since': feed['version']}).json()['plans'],
+                         {'upserted': [], 'deleted': []})
+
+    def test_bad_since(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/changes/', {'since': 'yesterday'}).status_code, 400)
+
+
+class StreamingTransactionsTests(RatesTestCase):
+    def test_stream_matches_the_paged_listing(self):
+        self.add_transactions(65)
+        self.client.force_login(self.user)
+        response = self.client.get('/get_transactions/', {'stream': '1', 'display_currency': 'EUR'})
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b''.join(response.streaming_content))
+        paged = self.client.get('/get_transactions/', {'limit': 500, 'display_currency': 'EUR'}).json()
+        self.assertEqual(streamed['transactions'], paged['transactions'])
+        self.assertEqual(streamed['totals'], paged['totals'])
+        self.assertEqual(streamed['version'], paged['version'])
+
+    def test_stream_of_empty_history(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/get_transactions/', {'stream': '1'})
+        streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(streamed['transactions'], [])
+        self.assertEqual(streamed['totals'], {'earned': 0.0, 'spent': 0.0})
+
+
+class ColumnarTransactionsTests(RatesTestCase):
+    def decode(self, columns):
+        return [
+            {
+                'id': columns['id'][i],
+                'date': columns['date'][i],
+                'status': columns['status']['values'][columns['status']['codes'][i]],
+                'category__name': columns['category__name']['values'][columns['category__name']['codes'][i]],
+                'amount': columns['amount'][i],
+                'currency': columns['currency'],
+                'description': columns['description'][i],
+            }
+            for i in range(columns['count'])
+        ]
+
+    def test_columnar_decodes_to_the_row_format(self):
+        self.add_transactions(30)
+        self.client.force_login(self.user)
+        rows = self.client.get('/get_transactions/', {'display_currency': 'USD'}).json()
+        columnar = self.client.get('/get_transactions/', {'display_currency': 'USD', 'format': 'columnar'})
+        self.assertEqual(columnar['Content-Type'], 'application/vnd.spending-tracker.columnar+json')
+        self.assertEqual(self.decode(columnar.json()['transactions']), rows['transactions'])
+        by_accept = self.client.get('/get_transactions/', {'display_currency': 'USD'},
+                                    HTTP_ACCEPT='application/vnd.spending-tracker.columnar+json')
+        self.assertEqual(by_accept.json()['transactions'], columnar.json()['transactions'])
+        self.assertNotEqual(by_accept['ETag'], self.client.get('/get_transactions/', {'display_currency': 'USD'})['ETag'])
+
+    def test_compressed_columnar_body_is_much_smaller(self):
+        self.add_transactions(500)
+        self.client.force_login(self.user)
+        plain = self.client.get('/get_transactions/', {'limit': 500})
+        compressed = self.client.get('/get_transactions/', {'limit': 500, 'format': 'columnar'},
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.content) * 5, len(plain.content))
+
+
+class ChartDataTests(RatesTestCase):
+    def test_daily_buckets_match_per_row_conversion(self):
+        self.add_transactions(60)
+        transactions = Transaction.objects.filter(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            data = chart_data(transactions, 'EUR')
+        grouped = [q for q in queries if 'GROUP BY' in q['sql']]
+        self.assertEqual(len(grouped), 1)
+
+        spent_by_day = {}
+        balance_by_day = {}
+        for t in transactions:
+            amount = float(convert_currency(t.amount, t.currency, 'EUR', t.date))
+            if t.status == 'spent':
+                spent_by_day[str(t.date)] = spent_by_day.get(str(t.date), 0) + amount
+            balance_by_day[str(t.date)] = balance_by_day.get(str(t.date), 0) + (amount if t.status == 'earned' else -amount)
+        self.assertEqual([p['date'] for p in data['spending_trends']], sorted(spent_by_day))
+        for point in data['spending_trends']:
+            self.assertAlmostEqual(point['total'], spent_by_day[point['date']], places=6)
+        running = 0
+        for point, day in zip(data['net_balance_trends'], sorted(balance_by_day)):
+            running += balance_by_day[day]
+            self.assertEqual(point['date'], day)
+            self.assertAlmostEqual(point['total'], running, places=6)
+        self.assertAlmostEqual(sum(c['total'] for c in data['spending_by_category']),
+                               sum(spent_by_day.values()), places=6)
+
+    def test_month_buckets(self):
+        self.add_transactions(60)
+        data = chart_data(Transaction.objects.filter(user=self.user), 'USD', 'month')
+        self.assertEqual([p['date'] for p in data['net_balance_trends']], ['2025-01-01', '2025-02-01'])
+        self.assertEqual(chart_data(Transaction.objects.filter(user=self.user), 'USD', 'decade')['bucket'], 'day')
+
+    def test_category_totals_do_not_depend_on_the_bucket(self):
+        self.add_transactions(60)  # The week of 2025-01-27 straddles the 2025-02-01 rate snapshot
+        transactions = Transaction.objects.filter(user=self.user)
+        daily = chart_data(transactions, 'EUR')
+        for bucket in ['week', 'month']:
+            data = chart_data(transactions, 'EUR', bucket)
+            for key in ['spending_by_category', 'earning_by_category']:
+                self.assertEqual([c['category__name'] for c in data[key]], [c['category__name'] for c in daily[key]])
+                for entry, expected in zip(data[key], daily[key]):
+                    self.assertAlmostEqual(entry['total'], expected['total'], places=6)
+            self.assertAlmostEqual(data['net_balance_trends'][-1]['total'], daily['net_balance_trends'][-1]['total'],
+                                   places=6)
+
+
+class DailyCategoryTotalTests(RatesTestCase):
+    def assert_rollup_matches_transactions(self):
+        expected = sorted(
+            Transaction.objects.filter(user=self.user).order_by()
+            .values('date', 'category_id', 'status', 'currency').annotate(amount=Sum('amount'), count=Count('id'))
+            .values_list('date', 'category_id', 'status', 'currency', 'amount', 'count')
+        )
+        actual = sorted(DailyCategoryTotal.objects.filter(user=self.user)
+                        .values_list('date', 'category_id', 'status', 'currency', 'amount', 'count'))
+        self.assertEqual(actual, expected)
+
+    def test_kept_exact_through_create_update_and_delete(self):
+        self.add_transactions(12)
+        self.client.force_login(self.user)
+        created = self.client.post('/add_transaction/', json.dumps({
+            'date': '2025-01-03', 'status': 'spent', 'category': 'Food', 'amount': '7.25',
+            'currency': 'USD', 'description': 'Coffee'}), content_type='application/json',
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()['transaction']
+        self.assert_rollup_matches_transactions()
+        self.client.post(f"/update_transaction/{created['id']}/", json.dumps({'amount': '9.50'}),
+                         content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assert_rollup_matches_transactions()
+        self.client.post(f"/update_transaction/{created['id']}/", json.dumps({
+            'date': '2025-02-10', 'category': 'Salary', 'status': 'earned', 'currency': 'EUR'}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assert_rollup_matches_transactions()
+        self.client.post(f"/delete_transaction/{created['id']}/", HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assert_rollup_matches_transactions()
+        Transaction.objects.filter(user=self.user, category=self.food).first().delete()
+        self.assert_rollup_matches_transactions()
+        self.food.delete()
+        self.assert_rollup_matches_transactions()
+
+    def test_rebuild(self):
+        self.add_transactions(30)
+        DailyCategoryTotal.objects.filter(user=self.user).update(amount=0)
+        rebuild_daily_totals(self.user)
+        self.assert_rollup_matches_transactions()
+
+
+class ChartDataCacheTests(RatesTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def grouped_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/chart_data/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len([q for q in queries if 'GROUP BY' in q['sql']])
+
+    def test_repeat_requests_are_served_from_cache_until_data_changes(self):
+        self.add_transactions(20)
+        self.client.force_login(self.user)
+        params = {'display_currency': 'USD', 'bucket': 'month'}
+        data, grouped = self.grouped_queries(params)
+        self.assertEqual(grouped, 1)
+        self.assertEqual(data, chart_data(Transaction.objects.filter(user=self.user), 'USD', 'month'))
+        cached, grouped = self.grouped_queries(params)
+        self.assertEqual((cached, grouped), (data, 0))
+        self.assertEqual(self.grouped_queries({'display_currency': 'EUR', 'bucket': 'month'})[1], 1)
+
+        Transaction.objects.create(user=self.user, date=datetime.date(2025, 1, 9), status='spent',
+                                   category=self.food, amount=Decimal('5'), currency='USD', description='Snack')
+        fresh, grouped = self.grouped_queries(params)
+        self.assertEqual(grouped, 1)
+        self.assertNotEqual(fresh, data)
+
+    def test_new_rate_snapshots_make_cached_charts_unreachable(self):
+        self.add_transactions(20)
+        self.client.force_login(self.user)
+        params = {'display_currency': 'USD', 'bucket': 'month'}
+        data, grouped = self.grouped_queries(params)
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('4'), 'EUR': Decimal('1.1')},
+                         date=datetime.date(2025, 2, 1))
+        fresh, grouped = self.grouped_queries(params)
+        self.assertEqual(grouped, 1)
+        self.assertNotEqual(fresh, data)
+
+
+class DownsamplingTests(SimpleTestCase):
+    def series(self, count):
+        start = datetime.date(2020, 1, 1)
+        return [{'date': str(start + datetime.timedelta(days=i)), 'total': float((i * 37) % 101)}
+                for i in range(count)]
+
+    def test_short_series_are_untouched(self):
+        points = self.series(10)
+        self.assertIs(downsample_lttb(points, 10), points)
+        self.assertIs(downsample_lttb(points, None), points)
+
+    def test_long_series_are_bounded_and_keep_shape(self):
+        points = self.series(3000)
+        points[1234]['total'] = 10000.0  # A spike must survive
+        sampled = downsample_lttb(points, 200)
+        self.assertEqual(len(sampled), 200)
+        self.assertEqual(sampled[0], points[0])
+        self.assertEqual(sampled[-1], points[-1])
+        self.assertIn(points[1234], sampled)
+        self.assertEqual([p['date'] for p in sampled], sorted(p['date'] for p in sampled))
+
+
+class ChartDownsamplingTests(RatesTestCase):
+    def test_max_points_bounds_every_trend(self):
+        self.add_transactions(60)
+        self.client.force_login(self.user)
+        data = self.client.get('/chart_data/', {'max_points': 10}).json()
+        self.assertTrue(data['downsampled'])
+        for key in ['spending_trends', 'earning_trends', 'net_balance_trends']:
+            self.assertLessEqual(len(data[key]), 10)
+        full = self.client.get('/chart_data/').json()
+        self.assertFalse(full['downsampled'])
+        self.assertEqual(full['net_balance_trends'][-1], data['net_balance_trends'][-1])
+
+
+class FinancialSummaryTests(RatesTestCase):
+    def post_json(self, url, data=None):
+        return self.client.post(url, json.dumps(data or {}), content_type='application/json',
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def assert_summary_matches(self, currency):
+        summary = UserFinancialSummary.objects.get(user=self.user, currency=currency)
+        totals = convert_totals(Transaction.objects.filter(user=self.user), currency)
+        self.assertAlmostEqual(summary.total_earned, totals['earned'], places=4)
+        self.assertAlmostEqual(summary.total_spent, totals['spent'], places=4)
+
+    def test_summaries_follow_transaction_writes(self):
+        self.add_transactions(12)
+        self.client.force_login(self.user)
+        get_financial_summary(self.user, 'USD')
+        get_financial_summary(self.user, 'EUR')
+        created = self.post_json('/add_transaction/', {
+            'date': '2025-01-20', 'status': 'spent', 'category': 'Food', 'amount': '40',
+            'currency': 'QAR', 'description': 'Dinner'}).json()['transaction']
+        self.post_json(f"/update_transaction/{created['id']}/", {'status': 'earned', 'date': '2025-02-02'})
+        self.post_json(f"/delete_transaction/{Transaction.objects.filter(user=self.user).first().id}/")
+        self.salary.delete()
+        for currency in ['USD', 'EUR']:
+            self.assert_summary_matches(currency)
+
+    def test_new_rate_snapshots_recompute_stale_summaries(self):
+        self.add_transactions(12)
+        summary = get_financial_summary(self.user, 'USD')
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('4'), 'EUR': Decimal('1.1')},
+                         date=datetime.date(2025, 2, 5))
+        self.assertTrue(UserFinancialSummary.objects.filter(id=summary.id).exists())
+        refreshed = get_financial_summary(self.user, 'USD')
+        self.assertEqual(refreshed.id, summary.id)
+        self.assertNotEqual(refreshed.total_spent, summary.total_spent)
+        self.assert_summary_matches('USD')
+        with self.assertNumQueries(1):
+            get_financial_summary(self.user, 'USD')
+
+    def test_snapshots_stored_by_another_process_reset_the_rate_caches(self):
+        self.add_transactions(12)
+        get_financial_summary(self.user, 'USD')
+        # Another process stores a snapshot: this process's caches keep the old rates, the shared version moves on
+        ExchangeRate.objects.filter(date=datetime.date(2025, 1, 1), currency='QAR').update(
+            rate=Decimal('4'), fetched_at=timezone.now())
+        cache.delete(RATES_VERSION_CACHE_KEY)
+        get_financial_summary(self.user, 'USD')
+        self.assert_summary_matches('USD')
+
+    def test_profile_reads_summary_without_writing_the_session(self):
+        self.add_transactions(8)
+        self.client.force_login(self.user)
+        self.client.get('/profile/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')])
+        self.assertNotIn('total_spent', self.client.session)
+        summary = UserFinancialSummary.objects.get(user=self.user)
+        self.assertEqual(response.context['total_spent'], float(summary.total_spent))
+
+
+class SpendingAnalyticsTests(SimpleTestCase):
+    today = datetime.date(2025, 3, 31)
+
+    def arrays(self, rows):
+        """rows of (date, amount, status, category) as the arrays load_spending_arrays returns."""
+        names = sorted({row[3] for row in rows})
+        return (
+            np.array([row[0].toordinal() - EPOCH_ORDINAL for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.float64),
+            np.array([row[2] == 'spent' for row in rows]),
+            np.array([names.index(row[3]) for row in rows], dtype=np.int64),
+            names,
+        )
+
+    def test_month_over_month_rolling_averages_and_anomalies(self):
+        rows = [(datetime.date(2025, 1, 1) + datetime.timedelta(days=i), 10.0, 'spent', 'Food') for i in range(90)]
+        rows += [
+            (datetime.date(2025, 2, 10), 40.0, 'spent', 'Rent'),
+            (datetime.date(2025, 3, 10), 60.0, 'spent', 'Rent'),
+            (datetime.date(2025, 3, 20), 500.0, 'spent', 'Food'),
+            (datetime.date(2025, 3, 21), 9999.0, 'earned', 'Salary'),
+        ]
+        analytics = compute_spending_analytics(*self.arrays(rows), self.today)
+        by_category = {entry['category']: entry for entry in analytics['month_over_month']}
+        self.assertEqual(set(by_category), {'Food', 'Rent'})
+        self.assertEqual(by_category['Rent']['month'], '2025-03')
+        self.assertEqual(by_category['Rent']['change'], 0.5)
+        self.assertEqual(by_category['Food']['current'], 810.0)
+        self.assertEqual(by_category['Food']['previous'], 280.0)
+        self.assertEqual(analytics['rolling_averages'], {'30d': round(860 / 30, 2), '90d': round(1500 / 90, 2)})
+        self.assertEqual([a['date'] for a in analytics['anomalies']], ['2025-03-20'])
+
+    def test_without_spending(self):
+        rows = [(datetime.date(2025, 3, 1), 100.0, 'earned', 'Salary')]
+        analytics = compute_spending_analytics(*self.arrays(rows), self.today)
+        self.assertEqual(analytics['month_over_month'], [])
+        self.assertEqual(analytics['anomalies'], [])
+        self.assertEqual(analytics['rolling_averages'], {'30d': 0.0, '90d': 0.0})
+
+    def test_only_future_spending(self):
+        for days_ahead in (1, 2, 3, 40):
+            rows = [(self.today + datetime.timedelta(days=days_ahead), 25.0, 'spent', 'Food')]
+            analytics = compute_spending_analytics(*self.arrays(rows), self.today)
+            self.assertEqual(analytics['rolling_averages'], {'30d': 0.0, '90d': 0.0})
+            self.assertEqual(analytics['month_over_month'][0]['current'], 25.0)
+
+
+class CachedSpendingAnalyticsTests(RatesTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_arrays_are_converted_to_the_display_currency(self):
+        self.add_transactions(20)
+        days, amounts, spent, codes, names = load_spending_arrays(self.user, 'EUR')
+        expected = convert_totals(Transaction.objects.filter(user=self.user), 'EUR')
+        self.assertAlmostEqual(amounts[spent].sum(), float(expected['spent']), places=4)
+        self.assertEqual(names, ['Food'])
+
+    def test_vectorised_rates_match_convert_many(self):
+        self.add_transactions(30)
+        for date, currency in [(datetime.date(2024, 12, 5), 'EUR'), (datetime.date(2025, 3, 1), 'GBP')]:
+            Transaction.objects.create(user=self.user, date=date, status='spent', category=self.food,
+                                       amount=Decimal('7'), currency=currency)  # Before any snapshot / no history
+        rows = list(DailyCategoryTotal.objects.filter(user=self.user, status='spent')
+                    .values_list('amount', 'currency', 'date'))
+        for display_currency in ['QAR', 'USD']:
+            amounts = load_spending_arrays(self.user, display_currency)[1]
+            expected = [float(amount) for amount in convert_many(rows, display_currency)]
+            np.testing.assert_allclose(amounts, expected, rtol=1e-9)
+
+    def test_hundred_thousand_transactions_fit_the_inline_budget(self):
+        rng = np.random.default_rng(42)
+        count = 100000
+        categories = [self.food, self.salary] + [
+            Category.objects.create(name=f'Category {i}', user=self.user) for i in range(18)]
+        today = datetime.date.today()
+        keys = zip(rng.integers(0, 3 * 365, count).tolist(), rng.integers(0, len(categories), count).tolist(),
+                   (rng.random(count) < 0.8).tolist(), rng.integers(0, 3, count).tolist())
+        DailyCategoryTotal.objects.bulk_create([
+            DailyCategoryTotal(user=self.user, date=today - datetime.timedelta(days=days_ago),
+                               category=categories[category], status='spent' if spent else 'earned',
+                               currency=['QAR', 'USD', 'EUR'][currency], amount=Decimal('12.35') * n, count=n)
+            for (days_ago, category, spent, currency), n in Counter(keys).items()
+        ], batch_size=5000)
+        get_spending_analytics(self.user, 'QAR')
+        cache.clear()
+        started = time.perf_counter()
+        get_spending_analytics(self.user, 'QAR')
+        self.assertLess(time.perf_counter() - started, 0.5)  # Measured at 0.2-0.25 s for ~46k spending rows
+
+    def test_cached_until_the_data_or_rates_version_changes(self):
+        self.add_transactions(20)
+        first = get_spending_analytics(self.user, 'QAR')
+        with self.assertNumQueries(1):  # Only the data version lookup
+            self.assertEqual(get_spending_analytics(self.user, 'QAR'), first)
+        Transaction.objects.create(user=self.user, date=datetime.date(2025, 2, 27), status='spent',
+                                   category=self.food, amount=Decimal('5000'), currency='QAR')
+        updated = get_spending_analytics(self.user, 'QAR')
+        self.assertNotEqual(updated, first)
+        store_rate_table('USD', {'USD': Decimal('1'), 'QAR': Decimal('4'), 'EUR': Decimal('1.1')},
+                         date=datetime.date(2025, 2, 5))
+        self.assertNotEqual(get_spending_analytics(self.user, 'QAR'), updated)
+
+    def test_profile_includes_insights(self):
+        self.add_transactions(20)
+        self.client.force_login(self.user)
+        response = self.client.get('/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('rolling_averages', response.context['analytics'])
+        self.assertTrue(response.context['ai_recommendation'].startswith(
+            UserFinancialSummary.objects.get(user=self.user).ai_recommendation))
+
+
+class PlanAdjustmentTests(RatesTestCase):
+    def create_plan(self, categories, amount='100', **kwargs):
+        today = datetime.date.today()
+        fields = {'from_date': today - datetime.timedelta(days=1), 'to_date': today + datetime.timedelta(days=30)}
+        fields.update(kwargs)
+        plan = Plan.objects.create(user=self.user, type='custom', amount=Decimal(amount), description='Plan', **fields)
+        plan.categories.set(categories)
+        return plan
+
+    def test_deducts_from_matching_and_all_category_plans_in_one_update(self):
+        everything = self.create_plan([Category.objects.create(name='All', user=self.user)])
+        food = self.create_plan([self.food, self.salary], amount='30')
+        salary = self.create_plan([self.salary])
+        expired = self.create_plan([self.food], to_date=datetime.date.today() - datetime.timedelta(days=1))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(deduct_from_plans(self.user, 'Food', 45.5), 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "spending_tracker_app_plan"')]), 1)
+        for plan, left_money in [(everything, '54.50'), (food, '0'), (salary, '100'), (expired, '100')]:
+            plan.refresh_from_db()
+            self.assertEqual(plan.left_money, Decimal(left_money))
+        entries = ChangeLogEntry.objects.filter(user=self.user, entity='plan', version=get_data_version(self.user))
+        self.assertEqual(set(entries.values_list('object_id', flat=True)), {everything.id, food.id})
+
+    def test_add_to_plans_restores_budget(self):
+        plan = self.create_plan([self.food])
+        deduct_from_plans(self.user, 'Food', 40)
+        self.assertEqual(add_to_plans(self.user, 'Food', 15), 1)
+        self.assertEqual(add_to_plans(self.user, 'Rent', 15), 0)
+        plan.refresh_from_db()
+        self.assertEqual(plan.left_money, Decimal('75'))
+
+
+class ConcurrentPlanAdjustmentTests(TransactionTestCase):
+    def setUp(self):
+        # Checked here rather than at import time, once the test database is set up
+        if not connection.features.has_select_for_update:
+            self.skipTest("the database has no row locks, so concurrent writers fail instead of queueing")
+
+    def test_parallel_transactions_do_not_lose_updates(self):
+        user = User.objects.create_user('bob', 'bob@example.com', 'password')
+        food = Category.objects.create(name='Food', user=user)
+        today = datetime.date.today()
+        plan = Plan.objects.create(user=user, type='custom', amount=Decimal('1000'), description='Groceries',
+                                   from_date=today, to_date=today + datetime.timedelta(days=30))
+        plan.categories.set([food])
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def add_transaction():
+            try:
+                client = self.client_class()
+                client.force_login(user)
+                barrier.wait()
+                response = client.post('/add_transaction/', json.dumps({
+                    'date': today.isoformat(), 'status': 'spent', 'category': 'Food', 'amount': '12.5',
+                    'currency': 'QAR'}), content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+                if response.status_code != 200:
+                    errors.append(response.content)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=add_transaction) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        plan.refresh_from_db()
+        self.assertEqual(plan.left_money, Decimal('1000') - 8 * Decimal('12.5'))
+
+
+class PlanStatusTests(RatesTestCase):
+    def setUp(self):
+        super().setUp()
+        today = datetime.date.today()
+        last_month = today - datetime.timedelta(days=30)
+        self.plans = {
+            status: Plan.objects.create(user=self.user, type='custom', amount=Decimal('100'),
+                                        left_money=left_money, description=status, from_date=last_month,
+                                        to_date=to_date, status='Active')
+            for status, left_money, to_date in [
+                ('Active', Decimal('100'), today),
+                ('Completed', Decimal('-5'), today - datetime.timedelta(days=1)),
+                ('Failed', Decimal('20'), today - datetime.timedelta(days=1)),
+            ]
+        }
+
+    def test_listing_derives_statuses_without_writing(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/plans/')
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        statuses = {plan['description']: plan['status'] for plan in response.json()['plans']}
+        self.assertEqual(statuses, {status: status for status in self.plans})
+        self.assertEqual(set(Plan.objects.values_list('status', flat=True)), {'Active'})
+
+    def test_nightly_task_stores_statuses_in_chunks(self):
+        version = get_data_version(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(advance_plan_statuses(chunk_size=1), 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "spending_tracker_app_plan"')]), 2)
+        for status, plan in self.plans.items():
+            plan.refresh_from_db()
+            self.assertEqual(plan.status, status)
+        self.assertGreater(get_data_version(self.user), version)
+        self.assertEqual(advance_plan_statuses(), 0)
+
+
+class PlanReconciliationTests(RatesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.add_transactions(40)  # Spending on Food in January and February 2025
+        january = {'from_date': datetime.date(2025, 1, 1), 'to_date': datetime.date(2025, 1, 31)}
+        self.food_plan = self.create_plan([self.food], '1000', **january)
+        self.all_plan = self.create_plan([self.food, Category.objects.create(name='ALL', user=self.user)],
+                                         '100000', **january)
+        self.salary_plan = self.create_plan([self.salary], '50', **january)
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.other_plan = Plan.objects.create(user=other, type='custom', amount=Decimal('10'),
+                                              description='Other', left_money=Decimal('3'), **january)
+        self.other_plan.categories.set([Category.objects.create(name='Food', user=other)])
+        self.spent = Transaction.objects.filter(user=self.user, status='spent', category=self.food,
+                                                date__month=1).aggregate(total=Sum('amount'))['total']
+
+    def create_plan(self, categories, amount, **dates):
+        plan = Plan.objects.create(user=self.user, type='custom', amount=Decimal(amount), description='Plan',
+                                   left_money=Decimal('1'), **dates)
+        plan.categories.set(categories)
+        return plan
+
+    def test_recomputes_drifted_balances_from_the_ledger(self):
+        version = get_data_version(self.user)
+        stats = reconcile_plan_balances(chunk_size=1)
+        expected = {self.food_plan: Decimal('1000') - self.spent, self.all_plan: Decimal('100000') - self.spent,
+                    self.salary_plan: Decimal('50'), self.other_plan: Decimal('10')}
+        for plan, left_money in expected.items():
+            plan.refresh_from_db()
+            self.assertEqual(plan.left_money, left_money)
+        self.assertEqual(stats['plans'], 4)
+        self.assertEqual(stats['drifted'], 4)
+        self.assertEqual(stats['users'], 2)
+        self.assertEqual(stats['max_drift'], Decimal('99999') - self.spent)
+        self.assertGreater(get_data_version(self.user), version)
+        self.assertEqual(reconcile_plan_balances()['drifted'], 0)
+
+    def test_dry_run_only_reports(self):
+        stats = reconcile_plan_balances([self.user.id], dry_run=True)
+        self.assertEqual(stats['drifted'], 3)
+        self.assertEqual(set(Plan.objects.values_list('left_money', flat=True)), {Decimal('1'), Decimal('3')})
+
+
+class ExcelReportTests(RatesTestCase):
+    def test_streams_every_converted_row(self):
+        self.add_transactions(30)
+        self.client.force_login(self.user)
+        with self.settings(REPORT_CHUNK_SIZE=7, REPORT_SPOOL_MAX_SIZE=1024):
+            response = self.client.post('/generate_report/', {'format': 'excel', 'display_currency': 'USD',
+                                                              'filename': 'export'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="export.xlsx"')
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook['Transactions'].values)
+        self.assertEqual(rows[0], ('Date', 'Status', 'Category', 'Amount', 'Currency', 'Description'))
+        self.assertEqual(len(rows), 31)
+        expected = {
+            t.description: round(float(convert_currency(t.amount, t.currency, 'USD', t.date)), 6)
+            for t in Transaction.objects.filter(user=self.user)
+        }
+        self.assertEqual({row[5]: round(row[3], 6) for row in rows[1:]}, expected)
+        self.assertEqual({row[4] for row in rows[1:]}, {'USD'})
+
+
+class BackgroundReportTests(RatesTestCase):
+    """Runs the report jobs end to end with Celery in eager mode and MEDIA_ROOT in a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # The Celery app reads its CELERY_* configuration from the Django settings
+        overrides = self.settings(CELERY_TASK_ALWAYS_EAGER=True, MEDIA_ROOT=media_root, REPORT_CHUNK_SIZE=4)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.add_transactions(10)
+        self.client.force_login(self.user)
+
+    def request_report(self, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/generate_report/', {'async': '1', 'format': 'excel', **params})
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_job_runs_and_serves_the_file(self):
+        job = self.request_report(display_currency='USD', filename='background')
+        self.assertEqual(job['status'], 'pending')  # Answered before the job ran
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual((status['rows_processed'], status['rows_total']), (10, 10))
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="background.xlsx"')
+        workbook = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(len(list(workbook['Transactions'].values)), 11)
+        self.assertEqual(self.client.get(status['download_url'].split('?')[0] + '?token=forged').status_code, 410)
+
+    def test_pdf_jobs(self):
+        job = self.request_report(format='pdf', status='spent')
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['rows_total'], Transaction.objects.filter(user=self.user, status='spent').count())
+        response = self.client.get(status['download_url'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_same_request_for_unchanged_data_is_deduplicated(self):
+        first = self.request_report()
+        self.assertEqual(self.request_report()['job_id'], first['job_id'])
+        self.assertNotEqual(self.request_report(format='pdf')['job_id'], first['job_id'])
+        Transaction.objects.create(user=self.user, date=datetime.date(2025, 1, 9), status='spent',
+                                   category=self.food, amount=Decimal('3'), currency='QAR')
+        self.assertNotEqual(self.request_report()['job_id'], first['job_id'])
+        self.assertEqual(ReportJob.objects.count(), 3)
+
+    def test_unqueued_and_stale_jobs_are_not_reused(self):
+        with mock.patch('spending_tracker_app.views.generate_report_job.delay', side_effect=OSError('broker down')):
+            first = self.request_report()
+        self.assertEqual(self.client.get(first['status_url']).json()['status'], 'failed')
+        second = self.request_report(format='pdf')
+        self.assertNotEqual(second['job_id'], first['job_id'])
+        ReportJob.objects.filter(id=second['job_id']).update(
+            status='running', updated_at=timezone.now() - datetime.timedelta(hours=1))
+        third = self.request_report(format='pdf')
+        self.assertNotEqual(third['job_id'], second['job_id'])
+        self.assertEqual(ReportJob.objects.get(id=second['job_id']).status, 'failed')
+        self.assertEqual(self.client.get(third['status_url']).json()['status'], 'done')
+
+    def test_cleanup_removes_failed_and_stale_jobs(self):
+        hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        fresh = self.request_report()
+        for status in ['failed', 'pending', 'running']:
+            job = ReportJob.objects.create(user=self.user, params={}, params_digest=status, data_version=0,
+                                           status=status)
+            ReportJob.objects.filter(id=job.id).update(updated_at=hour_ago)
+        recent_failure = ReportJob.objects.create(user=self.user, params={}, params_digest='recent', data_version=0,
+                                                  status='failed')
+        cleanup_expired_reports()
+        self.assertEqual(set(ReportJob.objects.values_list('id', flat=True)),
+                         {uuid.UUID(fresh['job_id']), recent_failure.id})
+
+    def test_expired_reports_are_refused_and_cleaned_up(self):
+        job = self.request_report()
+        url = self.client.get(job['status_url']).json()['download_url']
+        stored = ReportJob.objects.get(id=job['job_id'])
+        ReportJob.objects.filter(id=stored.id).update(expires_at=timezone.now())
+        self.assertEqual(self.client.get(url).status_code, 410)
+        self.assertNotEqual(self.request_report()['job_id'], job['job_id'])
+        cleanup_expired_reports()
+        self.assertFalse(ReportJob.objects.filter(id=stored.id).exists())
+        self.assertFalse(stored.file.storage.exists(stored.file.name))
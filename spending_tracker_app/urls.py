@@ -17,10 +17,14 @@ urlpatterns = [
     path('update_plan/<int:plan_id>/', views.update_plan, name='update_plan'),
     path('delete_plan/<int:plan_id>/', views.delete_plan, name='delete_plan'),
     path('generate_report/', views.generate_report, name='generate_report'),
+    path('reports/<uuid:job_id>/', views.report_status, name='report_status'),
+    path('reports/<uuid:job_id>/download/', views.download_report, name='download_report'),
     path('add_category/', views.add_category, name='add_category'),
     path('get_categories/', views.get_categories, name='get_categories'),
     path('get_transactions/', views.get_transactions, name='get_transactions'),  # New URL for fetching transactions
+    path('changes/', views.changes, name='changes'),  # Incremental sync: ?since=<data version>
     path('charts/', views.charts, name='charts'),  # New charts page
+    path('chart_data/', views.chart_data_api, name='chart_data'),  # Chart series as JSON for charts.html
     path('profile/', views.profile, name='profile'),  # New profile page for AI recommendations
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
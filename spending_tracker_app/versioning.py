@@ -0,0 +1,74 @@
+import datetime
+import hashlib
+from django.db import transaction
+from django.db.models import F
+from .exchange_rates import get_rates_version
+from .models import UserProfile, ChangeLogEntry
+
+
+def get_data_version(user):
+    """Returns the user's current data version (0 if they have no profile)."""
+    return UserProfile.objects.filter(user=user).values_list('data_version', flat=True).first() or 0
+
+
+def bump_data_version(user_id):
+    """
+    Increments the user's data version in a single UPDATE and returns the new version.
+    Called from the model signals, so bulk writes that skip signals (bulk_create,
+    QuerySet.update) must call it themselves.
+    """
+    UserProfile.objects.filter(user_id=user_id).update(data_version=F('data_version') + 1)
+    return UserProfile.objects.filter(user_id=user_id).values_list('data_version', flat=True).first() or 0
+
+
+def record_change(user_id, entity, object_id, deleted=False):
+    """
+    Bumps the user's data version and stores it as the latest change of one object.
+    The profile row stays locked until the surrounding transaction commits, so versions
+    become visible to the change feed in the order they were handed out.
+    """
+    with transaction.atomic():
+        version = bump_data_version(user_id)
+        if not version:  # The profile is gone, so the user is being deleted along with their rows
+            return None
+        ChangeLogEntry.objects.bulk_create(
+            [ChangeLogEntry(user_id=user_id, entity=entity, object_id=object_id, version=version, deleted=deleted)],
+            update_conflicts=True,
+            unique_fields=['user', 'entity', 'object_id'],
+            update_fields=['version', 'deleted'],
+        )
+    return version
+
+
+def record_changes(user_id, entity, object_ids):
+    """
+    record_change for several objects written by one set-based UPDATE, which skips the
+    post_save signals. All of them share a single new data version.
+    """
+    object_ids = list(object_ids)
+    if not object_ids:
+        return None
+    with transaction.atomic():
+        version = bump_data_version(user_id)
+        ChangeLogEntry.objects.bulk_create(
+            [ChangeLogEntry(user_id=user_id, entity=entity, object_id=object_id, version=version)
+             for object_id in object_ids],
+            update_conflicts=True,
+            unique_fields=['user', 'entity', 'object_id'],
+            update_fields=['version', 'deleted'],
+        )
+    return version
+
+
+def data_version_etag(request, *args, **kwargs):
+    """
+    ETag for the JSON endpoints, for use with django.views.decorators.http.condition.
+
+    Combines the user's data version with the rates version (converted amounts change
+    when new rate snapshots are stored), today's date (plan statuses and the rate used
+    for today's transactions change with the day, not with the data) and a digest of the
+    path, query string and Accept header, so revalidating an unchanged response costs one profile lookup.
+    """
+    version = get_data_version(request.user)
+    digest = hashlib.md5(f"{request.get_full_path()} {request.headers.get('Accept', '')}".encode()).hexdigest()[:12]
+    return f"{version}-{get_rates_version()}-{datetime.date.today().isoformat()}-{digest}"
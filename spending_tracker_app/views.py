@@ -1,4 +1,3 @@
-import os
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
@@ -7,28 +6,34 @@ from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.cache import patch_vary_headers
 from django.shortcuts import redirect
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.contrib import messages
 from .models import UserProfile
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.db import IntegrityError, transaction
-from django.http import JsonResponse, HttpResponse
-from .models import Transaction, Category, Plan
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse
+from .models import Transaction, Category, Plan, ChangeLogEntry, DailyCategoryTotal, ReportJob
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-import openpyxl
-from django.db.models import Q, Sum, Count
+from django.db.models import Q, Sum, F, Value, DecimalField
+from django.db.models.functions import Greatest, TruncDay, TruncWeek, TruncMonth
 from django.core.serializers.json import DjangoJSONEncoder
 import json
+import hashlib
 import datetime
+from itertools import islice
 import logging
 from decimal import Decimal
 from io import BytesIO
-from reportlab.lib.pagesizes import LETTER
 from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.core.mail import EmailMultiAlternatives
@@ -36,37 +41,17 @@ from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import timedelta
 import uuid
-import requests
-import socket
-import time
+from .exchange_rates import convert_currency, convert_many, convert_totals, get_rates_version
+from .versioning import data_version_etag, get_data_version, record_changes
+from .summaries import get_financial_summary
+from .analytics import get_spending_analytics
+from .reports import (REPORT_FORMATS, check_download_token, find_or_create_report_job, report_job_status,
+                      report_params, report_transactions, spooled_excel_report)
+from .tasks import generate_report_job
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Exchange rate API configuration (using exchangerate-api.com with your valid API key)
-EXCHANGE_RATE_API_URL = "https://v6.exchangerate-api.com/v6"
-API_ACCESS_KEY = os.getenv('API_ACCESS_KEY_exchange')
-
-
-def test_network_connectivity():
-    """
-    Tests if the server can resolve and connect to v6.exchangerate-api.com.
-    Returns True if successful, False otherwise.
-    """
-    try:
-        # Test DNS resolution
-        socket.getaddrinfo('v6.exchangerate-api.com', 443, socket.AF_INET, socket.SOCK_STREAM)
-        # Use GET request to /latest with API key to test connectivity
-        response = requests.get(
-            f"{EXCHANGE_RATE_API_URL}/{API_ACCESS_KEY}/latest/USD",
-            timeout=5
-        )
-        return response.status_code == 200
-    except (socket.gaierror, requests.RequestException) as e:
-        logger.error(f"Network connectivity test failed: {str(e)}")
-        return False
-
-
 
 def send_verification_email(user):
     try:
@@ -334,102 +319,179 @@ def password_reset_complete(request):
 
 
 
-def get_exchange_rate(from_currency, to_currency):
+TRANSACTION_FIELDS = ('id', 'date', 'status', 'category__name', 'amount', 'currency', 'description')
+TRANSACTION_PAGE_SIZE = 50
+MAX_TRANSACTION_PAGE_SIZE = 500
+TRANSACTION_STREAM_CHUNK_SIZE = 2000
+COLUMNAR_CONTENT_TYPE = 'application/vnd.spending-tracker.columnar+json'
+
+
+def filter_transactions(transactions, params):
+    """Applies the dashboard filters (start_date, end_date, status, category) from a GET/POST dict."""
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    status = params.get('status')
+    category = params.get('category')
+    if start_date and end_date:
+        transactions = transactions.filter(date__range=[start_date, end_date])
+    if status and status != "all":
+        transactions = transactions.filter(status=status)
+    if category and category != "":
+        transactions = transactions.filter(category__name=category)
+    return transactions
+
+
+def filter_daily_totals(user, params):
     """
-    Fetches the latest exchange rate from from_currency to to_currency using exchangerate-api.com API.
-    Returns a Decimal representing the conversion rate (to/from_currency).
-    Handles QAR and other currencies, with fallback to comprehensive hardcoded rates if API fails.
-    Ensures a Decimal is always returned (never None).
+    The user's DailyCategoryTotal rows narrowed by the same dashboard filters as their transactions.
+    Totals and charts aggregate these instead of scanning every transaction.
     """
-    if from_currency == to_currency:
-        return Decimal('1')
+    return filter_transactions(DailyCategoryTotal.objects.filter(user=user), params)
+
+
+def encode_cursor(row):
+    """Encodes the (date, id) position of a transaction row as an opaque cursor."""
+    return urlsafe_base64_encode(force_bytes(f"{row['date'].isoformat()}|{row['id']}"))
+
+
+def decode_cursor(cursor):
+    """Returns the (date, id) position encoded in cursor. Raises ValueError if it is malformed."""
+    try:
+        date, transaction_id = force_str(urlsafe_base64_decode(cursor)).split('|')
+        return datetime.date.fromisoformat(date), int(transaction_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def paginate_transactions(transactions, cursor=None, limit=None):
+    """
+    Returns one page of transaction value rows, newest first, and the cursor of the next page.
+    Pages are keyed on (date, id) rather than offsets, so every page costs one bounded index
+    range scan no matter how deep into the history it is. Raises ValueError for a bad cursor.
+    """
+    try:
+        limit = min(max(int(limit), 1), MAX_TRANSACTION_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = TRANSACTION_PAGE_SIZE
+    transactions = transactions.order_by('-date', '-id')
+    if cursor:
+        date, transaction_id = decode_cursor(cursor)
+        transactions = transactions.filter(Q(date__lt=date) | Q(date=date, id__lt=transaction_id))
+    rows = list(transactions.values(*TRANSACTION_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def serialize_transactions(rows, display_currency):
+    """Converts transaction value rows to display_currency as the dicts sent to templates and script.js."""
+    converted_amounts = convert_many(((t['amount'], t['currency'], t['date']) for t in rows), display_currency)
+    return [
+        {
+            'id': t['id'],
+            'date': t['date'].strftime('%Y-%m-%d'),
+            'status': t['status'],
+            'category__name': t['category__name'],
+            'amount': float(converted_amount),
+            'currency': display_currency,
+            'description': t['description'],
+        }
+        for t, converted_amount in zip(rows, converted_amounts)
+    ]
+
+
+def wants_columnar(request):
+    """True if the client asked for columnar transactions with ?format=columnar or the Accept header."""
+    return request.GET.get('format') == 'columnar' or COLUMNAR_CONTENT_TYPE in request.headers.get('Accept', '')
+
+
+def dictionary_encode(values):
+    """Returns {'values': distinct values in first-seen order, 'codes': index of each value in them}."""
+    index = {}
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return {'values': list(index), 'codes': codes}
 
-    # Test network connectivity before API call
-    if not test_network_connectivity():
-        logger.warning("Network connectivity issue detected. Using hardcoded rates.")
-    else:
-        try:
-            # Check rate limits and introduce a small delay to avoid overload
-            time.sleep(1)  # Delay to respect rate limits (adjust as needed)
-
-            # Fetch exchange rates with from_currency as base and valid API key
-            url = f"{EXCHANGE_RATE_API_URL}/{API_ACCESS_KEY}/latest/{from_currency}"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            data = response.json()
-            if 'error' in data:
-                raise ValueError(f"API error: {data['error']}")
-            rate = data['conversion_rates'].get(to_currency, 1.0)  # Use conversion_rates for exchangerate-api.com
-            if rate is None or rate == 0:
-                raise ValueError("Invalid rate received from API")
-            logger.debug(f"Exchange rate from {from_currency} to {to_currency}: {rate}")
-            return Decimal(str(rate))
-        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
-            logger.error(f"Failed to fetch exchange rate from {from_currency} to {to_currency}: {str(e)}")
-            # Fallback to comprehensive hardcoded rates (updated for accuracy as of Feb 2025)
-            HARD_CODED_RATES = {
-                ('QAR', 'USD'): Decimal('0.2747'),  # 1 QAR ≈ 0.2747 USD
-                ('USD', 'QAR'): Decimal('3.641'),  # 1 USD ≈ 3.641 QAR
-                ('QAR', 'EUR'): Decimal('0.254'),  # 1 QAR ≈ 0.254 EUR
-                ('EUR', 'QAR'): Decimal('3.937'),  # 1 EUR ≈ 3.937 QAR
-                ('USD', 'EUR'): Decimal('0.924'),  # 1 USD ≈ 0.924 EUR
-                ('EUR', 'USD'): Decimal('1.082'),  # 1 EUR ≈ 1.082 USD
-            }
-            # Ensure all pairs are covered by adding reciprocal rates
-            for (curr1, curr2), rate in list(HARD_CODED_RATES.items()):
-                if (curr2, curr1) not in HARD_CODED_RATES:
-                    HARD_CODED_RATES[(curr2, curr1)] = Decimal('1') / rate if rate != Decimal('0') else Decimal('1')
 
-            rate = HARD_CODED_RATES.get((from_currency, to_currency), Decimal('1'))
-            logger.warning(f"Using hardcoded rate for {from_currency} to {to_currency}: {rate}")
-            return rate  # Ensure a Decimal is returned, never None
+def columnar_transactions(serialized):
+    """
+    Turns the row dicts from serialize_transactions into parallel arrays, one per field.
+    Status and category are dictionary-encoded and the currency, which is the display
+    currency on every row, is sent once. script.js turns it back into rows with decodeTransactions.
+    """
+    return {
+        'count': len(serialized),
+        'currency': serialized[0]['currency'] if serialized else None,
+        'id': [t['id'] for t in serialized],
+        'date': [t['date'] for t in serialized],
+        'status': dictionary_encode([t['status'] for t in serialized]),
+        'category__name': dictionary_encode([t['category__name'] for t in serialized]),
+        'amount': [t['amount'] for t in serialized],
+        'description': [t['description'] for t in serialized],
+    }
 
 
-def convert_currency(amount, from_curr, to_curr):
-    """Converts 'amount' from from_curr -> to_curr based on API or hardcoded rates."""
-    rate = get_exchange_rate(from_curr, to_curr)
-    if rate is None:  # Fallback if rate is somehow None (shouldn't happen with the above change)
-        logger.error(f"Rate for {from_curr} to {to_curr} is None, using default rate of 1")
-        rate = Decimal('1')
-    return amount * rate
+def stream_transactions_json(transactions, daily_totals, display_currency, version):
+    """
+    Yields the JSON document {"transactions": [...], "totals": {...}, "version": n} piece by piece.
+    Rows are read with a server-side cursor TRANSACTION_STREAM_CHUNK_SIZE at a time and each chunk
+    is converted and encoded before the next is fetched, so memory does not grow with the history.
+    """
+    rows = transactions.order_by('-date', '-id').values(*TRANSACTION_FIELDS).iterator(
+        chunk_size=TRANSACTION_STREAM_CHUNK_SIZE)
+    yield '{"transactions": ['
+    separator = ''
+    while True:
+        chunk = list(islice(rows, TRANSACTION_STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield separator + ', '.join(json.dumps(t, cls=DjangoJSONEncoder)
+                                    for t in serialize_transactions(chunk, display_currency))
+        separator = ', '
+    totals = convert_totals(daily_totals, display_currency)
+    yield '], "totals": ' + json.dumps({'earned': float(totals['earned']), 'spent': float(totals['spent'])})
+    yield f', "version": {version}}}'
+
+
+def transaction_page_response(request, transactions, daily_totals):
+    """
+    Returns the JSON for one page of transactions: the rows, next_cursor, and, on the first
+    page only, the totals of the whole filtered history. The rows are in columnar form when
+    wants_columnar(request).
+    """
+    display_currency = request.GET.get('display_currency', 'QAR')
+    cursor = request.GET.get('cursor')
+    version = get_data_version(request.user)  # Read before the data so /changes/ never skips anything
+    try:
+        rows, next_cursor = paginate_transactions(transactions, cursor, request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    serialized = serialize_transactions(rows, display_currency)
+    columnar = wants_columnar(request)
+    data = {
+        'transactions': columnar_transactions(serialized) if columnar else serialized,
+        'next_cursor': next_cursor,
+        'version': version,
+    }
+    if not cursor:
+        totals = convert_totals(daily_totals, display_currency)
+        data['totals'] = {'earned': float(totals['earned']), 'spent': float(totals['spent'])}
+    response = JsonResponse(data, encoder=DjangoJSONEncoder, safe=False,
+                            content_type=COLUMNAR_CONTENT_TYPE if columnar else 'application/json')
+    patch_vary_headers(response, ['Accept'])
+    return response
 
 @login_required
 def index(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date')
     categories = Category.objects.filter(user=request.user)
-    if request.method == "GET":
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        status = request.GET.get('status')
-        category = request.GET.get('category')
-        display_currency = request.GET.get('display_currency', 'QAR')
-
-        if start_date and end_date:
-            transactions = transactions.filter(date__range=[start_date, end_date])
-        if status and status != "all":
-            transactions = transactions.filter(status=status)
-        if category and category != "":
-            transactions = transactions.filter(category__name=category)
-
-    converted_transactions = []
-    total_earned = Decimal('0')
-    total_spent = Decimal('0')
-
-    for t in transactions:
-        converted_amount = convert_currency(t.amount, t.currency, display_currency)
-        converted_transactions.append({
-            'id': t.id,
-            'date': t.date.strftime('%Y-%m-%d'),
-            'status': t.status,
-            'category__name': t.category.name if t.category else 'undefined',
-            'amount': float(converted_amount),
-            'currency': display_currency,
-            'description': t.description,
-        })
-        if t.status == 'earned':
-            total_earned += converted_amount
-        elif t.status == 'spent':
-            total_spent += converted_amount
+    display_currency = request.GET.get('display_currency', 'QAR')
+    transactions = filter_transactions(Transaction.objects.filter(user=request.user), request.GET)
+
+    # Only the first page is rendered; script.js loads further pages from get_transactions
+    try:
+        rows, next_cursor = paginate_transactions(transactions, limit=request.GET.get('limit'))
+    except ValueError:
+        rows, next_cursor = [], None
+    converted_transactions = serialize_transactions(rows, display_currency)
+    totals = convert_totals(filter_daily_totals(request.user, request.GET), display_currency)
 
     profile = request.user.userprofile
     if not profile.email_verified:
@@ -441,97 +503,156 @@ def index(request):
 
     context = {
         'transactions': converted_transactions,
+        'next_cursor': next_cursor,
         'categories': categories,
         'display_currency': display_currency,
-        'total_earned': float(total_earned),
-        'total_spent': float(total_spent),
+        'total_earned': float(totals['earned']),
+        'total_spent': float(totals['spent']),
         'user_preferred_currency': UserProfile.objects.get(user=request.user).preferred_currency
 
     }
     return render(request, 'index.html', context)
 
 
+CHART_BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def downsample_lttb(points, max_points):
+    """
+    Reduces a time series of {'date', 'total'} points to at most max_points with
+    Largest-Triangle-Three-Buckets: the first and last points are kept, and from each of
+    the equal-sized buckets in between the point forming the largest triangle with the
+    previously kept point and the next bucket's average is kept, which preserves peaks,
+    dips and the overall shape of the line.
+    """
+    count = len(points)
+    if max_points is None or count <= max_points:
+        return points
+    max_points = max(max_points, 3)
+    xs = [datetime.date.fromisoformat(p['date']).toordinal() for p in points]
+    ys = [p['total'] for p in points]
+    every = (count - 2) / (max_points - 2)
+    sampled = [points[0]]
+    previous = 0
+    for i in range(max_points - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        chosen = max(
+            range(int(i * every) + 1, int((i + 1) * every) + 1),
+            key=lambda j: abs((xs[previous] - average_x) * (ys[j] - ys[previous])
+                              - (xs[previous] - xs[j]) * (average_y - ys[previous])),
+        )
+        sampled.append(points[chosen])
+        previous = chosen
+    sampled.append(points[-1])
+    return sampled
+
+
+def chart_data(transactions, display_currency, bucket='day', max_points=None):
+    """
+    Returns the charts page datasets for a Transaction or DailyCategoryTotal queryset in display_currency:
+    spending/earning totals per category, spending/earning trends per day, week or month
+    bucket, and the cumulative net balance at the end of each bucket.
+
+    Everything comes from one grouped query over (status, category, currency, date), whose
+    size depends on the number of days and categories rather than on the number of rows.
+    Each group is converted at its own day's rate and then summed into its bucket, so the
+    category totals are the same whichever bucket is chosen, and the net balance is
+    accumulated in a single pass over the sorted buckets.
+    With max_points, each trend is downsampled to at most that many points.
+    """
+    if bucket not in CHART_BUCKETS:
+        bucket = 'day'
+    groups = list(
+        transactions.filter(status__in=['spent', 'earned']).order_by()
+        .annotate(bucket=CHART_BUCKETS[bucket]('date'))
+        .values('status', 'category__name', 'currency', 'date', 'bucket')
+        .annotate(total=Sum('amount'))
+    )
+    converted_totals = convert_many(((g['total'], g['currency'], g['date']) for g in groups), display_currency)
+    by_category = {'spent': {}, 'earned': {}}
+    by_bucket = {'spent': {}, 'earned': {}}
+    for group, converted_total in zip(groups, converted_totals):
+        total = float(converted_total)
+        category_name = group['category__name'] or 'N/A'
+        by_category[group['status']][category_name] = by_category[group['status']].get(category_name, 0) + total
+        by_bucket[group['status']][group['bucket']] = by_bucket[group['status']].get(group['bucket'], 0) + total
+
+    net_balance = 0
+    net_balance_trends = []
+    for day in sorted(by_bucket['spent'].keys() | by_bucket['earned'].keys()):
+        net_balance += by_bucket['earned'].get(day, 0) - by_bucket['spent'].get(day, 0)  # Cumulative balance
+        net_balance_trends.append({'date': day.strftime('%Y-%m-%d'), 'total': net_balance})
+
+    def category_list(totals):
+        return [{'category__name': name, 'total': total}
+                for name, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)]
+
+    def trend_list(totals):
+        return [{'date': day.strftime('%Y-%m-%d'), 'total': total} for day, total in sorted(totals.items())]
+
+    spending_trends = trend_list(by_bucket['spent'])
+    earning_trends = trend_list(by_bucket['earned'])
+    return {
+        'bucket': bucket,
+        'spending_by_category': category_list(by_category['spent']),
+        'earning_by_category': category_list(by_category['earned']),
+        'spending_trends': downsample_lttb(spending_trends, max_points),
+        'earning_trends': downsample_lttb(earning_trends, max_points),
+        'net_balance_trends': downsample_lttb(net_balance_trends, max_points),
+        'downsampled': max_points is not None and max(
+            len(spending_trends), len(earning_trends), len(net_balance_trends)) > max_points,
+    }
+
+
+CHART_FILTER_PARAMS = ('start_date', 'end_date', 'status', 'category', 'display_currency', 'bucket', 'max_points')
+
+
+def chart_max_points(params):
+    """The ?max_points= limit for trend series, capped at (and defaulting to) settings.CHART_MAX_POINTS."""
+    limit = getattr(settings, 'CHART_MAX_POINTS', 500)
+    try:
+        return min(max(int(params.get('max_points')), 3), limit)
+    except (TypeError, ValueError):
+        return limit
+
+
+def cached_chart_data(user, params):
+    """
+    chart_data for the user's filtered daily totals, served from the cache when possible.
+    The key includes the user's data version and the rates version, so any write or newly
+    stored rate snapshot makes earlier entries unreachable.
+    """
+    query = '&'.join(f"{name}={params.get(name, '')}" for name in CHART_FILTER_PARAMS)
+    key = (f"chart-data:{user.id}:{get_data_version(user)}:{get_rates_version()}:"
+           f"{hashlib.md5(query.encode()).hexdigest()}")
+    data = cache.get(key)
+    if data is None:
+        data = chart_data(filter_daily_totals(user, params), params.get('display_currency', 'QAR'),
+                          params.get('bucket', 'day'), chart_max_points(params))
+        cache.set(key, data, getattr(settings, 'CHART_DATA_CACHE_TIMEOUT', 3600))
+    return data
+
+
 @login_required
 def charts(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date')
     categories = Category.objects.filter(user=request.user)
 
-    if request.method == "GET":
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        status = request.GET.get('status')
-        category = request.GET.get('category')
-        display_currency = request.GET.get('display_currency', 'QAR')
-
-        if start_date and end_date:
-            transactions = transactions.filter(date__range=[start_date, end_date])
-        if status and status != "all":
-            transactions = transactions.filter(status=status)
-        if category and category != "":
-            transactions = transactions.filter(category__name=category)
-
-    # Convert spending and earning data to display currency
     display_currency = request.GET.get('display_currency', 'QAR')
-    spending_by_category = {}
-    earning_by_category = {}
-    spending_trends = []
-    earning_trends = []
-    net_balance_trends = []  # New dataset for net balance
-
-    # Aggregate by category for spending and earning
-    for t in transactions.filter(status='spent'):
-        converted_amount = convert_currency(t.amount, t.currency, display_currency)
-        category_name = t.category.name if t.category else 'N/A'
-        spending_by_category[category_name] = spending_by_category.get(category_name, 0) + float(converted_amount)
-
-    for t in transactions.filter(status='earned'):
-        converted_amount = convert_currency(t.amount, t.currency, display_currency)
-        category_name = t.category.name if t.category else 'N/A'
-        earning_by_category[category_name] = earning_by_category.get(category_name, 0) + float(converted_amount)
-
-    # Convert to lists for template
-    spending_by_category_list = [{'category__name': k, 'total': v} for k, v in spending_by_category.items()]
-    earning_by_category_list = [{'category__name': k, 'total': v} for k, v in earning_by_category.items()]
-
-    # Spending and earning trends by date
-    for t in transactions.filter(status='spent').values('date').annotate(total=Sum('amount')):
-        common_currency = transactions.filter(status='spent').values('currency').annotate(count=Count('currency')).order_by('-count').first()
-        currency = common_currency['currency'] if common_currency else 'QAR'
-        converted_amount = convert_currency(Decimal(str(t['total'])), currency, display_currency)
-        spending_trends.append({
-            'date': t['date'].strftime('%Y-%m-%d'),
-            'total': float(converted_amount),
-        })
-
-    for t in transactions.filter(status='earned').values('date').annotate(total=Sum('amount')):
-        common_currency = transactions.filter(status='earned').values('currency').annotate(count=Count('currency')).order_by('-count').first()
-        currency = common_currency['currency'] if common_currency else 'QAR'
-        converted_amount = convert_currency(Decimal(str(t['total'])), currency, display_currency)
-        earning_trends.append({
-            'date': t['date'].strftime('%Y-%m-%d'),
-            'total': float(converted_amount),
-        })
-
-    # Calculate net balance trends (earnings - spending) cumulatively
-    all_dates = sorted(set([t['date'].strftime('%Y-%m-%d') for t in transactions.values('date')]))
-    net_balance = 0
-    for date in all_dates:
-        spending_on_date = next((t['total'] for t in spending_trends if t['date'] == date), 0)
-        earning_on_date = next((t['total'] for t in earning_trends if t['date'] == date), 0)
-        net_balance += (earning_on_date - spending_on_date)  # Cumulative balance
-        net_balance_trends.append({
-            'date': date,
-            'total': float(net_balance),
-        })
+    data = cached_chart_data(request.user, request.GET)
 
     context = {
         'categories': categories,
-        'spending_by_category': spending_by_category_list,
-        'earning_by_category': earning_by_category_list,
-        'spending_trends': spending_trends,
-        'earning_trends': earning_trends,
-        'net_balance_trends': net_balance_trends,  # New data for net balance
+        'spending_by_category': data['spending_by_category'],
+        'earning_by_category': data['earning_by_category'],
+        'spending_trends': data['spending_trends'],
+        'earning_trends': data['earning_trends'],
+        'net_balance_trends': data['net_balance_trends'],  # New data for net balance
         'display_currency': display_currency,
+        'bucket': data['bucket'],
+        'downsampled': data['downsampled'],
         'user_preferred_currency': UserProfile.objects.get(user=request.user).preferred_currency
     }
     return render(request, 'charts.html', context)
@@ -539,29 +660,24 @@ def charts(request):
 
 
 
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_version_etag)
+def chart_data_api(request):
+    """Returns the charts page datasets for the filters in the query string as JSON."""
+    try:
+        return JsonResponse(cached_chart_data(request.user, request.GET))
+    except Exception as e:
+        logger.error(f"Error in chart_data_api: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @login_required
 def profile(request):
-    transactions = Transaction.objects.filter(user=request.user)
     plans = Plan.objects.filter(user=request.user)
     display_currency = UserProfile.objects.get(user=request.user).preferred_currency
-
-    total_spent = Decimal('0')
-    total_earned = Decimal('0')
-    for t in transactions:
-        converted_amount = convert_currency(t.amount, t.currency, display_currency)
-        if t.status == 'earned':
-            total_earned += converted_amount
-        elif t.status == 'spent':
-            total_spent += converted_amount
-
-    ai_recommendation = "You are overspending if total spent exceeds 70% of total earned."
-    if total_spent > (Decimal('0.7') * total_earned) and total_earned > Decimal('0'):
-        ai_recommendation = "Warning: You are overspending! Consider reducing expenses or revising your plans."
-
-    # Store in session for error handling in change_password
-    request.session['total_earned'] = float(total_earned)
-    request.session['total_spent'] = float(total_spent)
-    request.session['ai_recommendation'] = ai_recommendation
+    summary = get_financial_summary(request.user, display_currency)
+    analytics = get_spending_analytics(request.user, display_currency)
 
     # Define currency options for the template
     currency_options = [
@@ -733,9 +849,10 @@ def profile(request):
     ]
 
     context = {
-        'total_spent': float(total_spent),
-        'total_earned': float(total_earned),
-        'ai_recommendation': ai_recommendation,
+        'total_spent': float(summary.total_spent),
+        'total_earned': float(summary.total_earned),
+        'ai_recommendation': ' '.join([summary.ai_recommendation] + analytics['insights']),
+        'analytics': analytics,
         'plans': plans,
         'display_currency': display_currency,
         'currency_options': currency_options,
@@ -776,7 +893,8 @@ def add_transaction(request):
                 deduct_from_plans(request.user, category.name, float(amount))
 
             display_currency = request.GET.get('display_currency', 'QAR')
-            converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency)
+            converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency,
+                                                transaction.date)
             currency = display_currency
 
             return JsonResponse({
@@ -788,7 +906,8 @@ def add_transaction(request):
                     'amount': float(converted_amount),
                     'currency': currency,
                     'description': transaction.description
-                }
+                },
+                'version': get_data_version(request.user),
             }, encoder=DjangoJSONEncoder, safe=False)
 
         except json.JSONDecodeError as e:
@@ -831,7 +950,8 @@ def update_transaction(request, transaction_id):
                 deduct_from_plans(request.user, category.name, float(amount))
 
             display_currency = request.GET.get('display_currency', 'QAR')
-            converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency)
+            converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency,
+                                                transaction.date)
             currency = display_currency
 
             return JsonResponse({
@@ -843,7 +963,8 @@ def update_transaction(request, transaction_id):
                     'amount': float(converted_amount),
                     'currency': currency,
                     'description': transaction.description
-                }
+                },
+                'version': get_data_version(request.user),
             }, encoder=DjangoJSONEncoder, safe=False)
 
         except json.JSONDecodeError as e:
@@ -859,7 +980,8 @@ def update_transaction(request, transaction_id):
 def get_transaction(request, transaction_id):
     transaction = get_object_or_404(Transaction, id=transaction_id, user=request.user)
     display_currency = request.GET.get('display_currency', 'QAR')  # Get from query params if available
-    converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency)
+    converted_amount = convert_currency(transaction.amount, transaction.currency, display_currency,
+                                                transaction.date)
     return JsonResponse({
         'id': transaction.id,
         'date': transaction.date.strftime('%Y-%m-%d'),
@@ -892,24 +1014,7 @@ def delete_transaction(request, transaction_id):
                 add_to_plans(request.user, transaction.category.name if transaction.category else '',
                              float(transaction.amount))
             transaction.delete()
-            # Convert transactions for the response
-            display_currency = request.GET.get('display_currency', 'QAR')  # Get from query params if available
-            transactions = Transaction.objects.filter(user=request.user).order_by('-date').values(
-                'id', 'date', 'status', 'category__name', 'amount', 'currency', 'description'
-            )
-            converted_transactions = []
-            for t in transactions:
-                conv_amount = convert_currency(Decimal(str(t['amount'])), t['currency'], display_currency)
-                converted_transactions.append({
-                    'id': t['id'],
-                    'date': t['date'],
-                    'status': t['status'],
-                    'category__name': t['category__name'],
-                    'amount': float(conv_amount),
-                    'currency': display_currency,
-                    'description': t['description'],
-                })
-            return JsonResponse({'transactions': converted_transactions}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({'deleted': transaction_id, 'version': get_data_version(request.user)})
         except Exception as e:
             logger.error(f"Error in delete_transaction for ID {transaction_id}: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -917,15 +1022,18 @@ def delete_transaction(request, transaction_id):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_version_etag)
 def plans(request):
     try:
-        plans = Plan.objects.filter(user=request.user)
-        for plan in plans:
-            plan.update_status()
-        plans_data = plans.values(
-            'id', 'type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'status'
-        )
-        return JsonResponse({'plans': list(plans_data)}, encoder=DjangoJSONEncoder, safe=False)
+        version = get_data_version(request.user)
+        # Statuses are derived at read time; the nightly advance_plan_statuses task stores them
+        plans_data = list(Plan.objects.filter(user=request.user).annotate(
+            current_status=Plan.status_expression(datetime.date.today())
+        ).values('id', 'type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'current_status'))
+        for plan in plans_data:
+            plan['status'] = plan.pop('current_status')
+        return JsonResponse({'plans': plans_data, 'version': version}, encoder=DjangoJSONEncoder, safe=False)
     except Exception as e:
         logger.error(f"Error in plans view: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -948,30 +1056,33 @@ def add_plan(request):
             )
             plan.categories.set(Category.objects.filter(name__in=categories, user=request.user))
             plan.save()
-            plans = Plan.objects.filter(user=request.user).values(
-                'id', 'type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'status'
-            )
-            return JsonResponse({'plans': list(plans)}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({'plan': serialize_plan(plan), 'version': get_data_version(request.user)})
         except Exception as e:
             logger.error(f"Error in add_plan: {str(e)}")
             return JsonResponse({'error': str(e)}, status=400)
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
 
-@login_required
-def get_plan(request, plan_id):
-    plan = get_object_or_404(Plan, id=plan_id, user=request.user)
-    return JsonResponse({
+def serialize_plan(plan):
+    return {
         'id': plan.id,
         'type': plan.type,
         'amount': float(plan.amount),
         'description': plan.description,
         'categories': [c.name for c in plan.categories.all()],
-        'from_date': plan.from_date.strftime('%Y-%m-%d'),
-        'to_date': plan.to_date.strftime('%Y-%m-%d'),
+        'from_date': str(plan.from_date),
+        'to_date': str(plan.to_date),
         'left_money': float(plan.left_money),
-        'status': plan.status
-    })
+        'status': plan.current_status()
+    }
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_version_etag)
+def get_plan(request, plan_id):
+    plan = get_object_or_404(Plan, id=plan_id, user=request.user)
+    return JsonResponse(serialize_plan(plan))
 
 
 @login_required
@@ -990,10 +1101,7 @@ def update_plan(request, plan_id):
             plan.categories.set(
                 Category.objects.filter(name__in=data.get('categories', '').split(','), user=request.user))
             plan.save()
-            plans = Plan.objects.filter(user=request.user).values(
-                'id', 'type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'status'
-            )
-            return JsonResponse({'plans': list(plans)}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({'plan': serialize_plan(plan), 'version': get_data_version(request.user)})
         except Exception as e:
             logger.error(f"Error in update_plan: {str(e)}")
             return JsonResponse({'error': str(e)}, status=400)
@@ -1006,10 +1114,7 @@ def delete_plan(request, plan_id):
         try:
             plan = get_object_or_404(Plan, id=plan_id, user=request.user)
             plan.delete()
-            plans = Plan.objects.filter(user=request.user).values(
-                'id', 'type', 'amount', 'description', 'from_date', 'to_date', 'left_money', 'status'
-            )
-            return JsonResponse({'plans': list(plans)}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({'deleted': plan_id, 'version': get_data_version(request.user)})
         except Exception as e:
             logger.error(f"Error in delete_plan: {str(e)}")
             return JsonResponse({'error': str(e)}, status=400)
@@ -1019,114 +1124,55 @@ def delete_plan(request, plan_id):
 @login_required
 def generate_report(request):
     if request.method == "POST":
-        start_date = request.POST.get('start_date')
-        end_date = request.POST.get('end_date')
-        status = request.POST.get('status')
-        category = request.POST.get('category')
-        format = request.POST.get('format', 'excel')
-        filename = request.POST.get('filename', 'report')
-        display_currency = request.POST.get('display_currency', 'QAR')
-
-        # Query only user's data
-        transactions = Transaction.objects.filter(user=request.user)
-
-        # Apply the same filters as in the index view
-        if start_date and end_date:
-            transactions = transactions.filter(date__range=[start_date, end_date])
-        if status and status != 'all':
-            transactions = transactions.filter(status=status)
-        if category and category != '':
-            transactions = transactions.filter(category__name=category)
-
-        # Convert all transaction amounts to the display currency
-        converted_transactions = []
-        for t in transactions:
-            converted_amount = convert_currency(t.amount, t.currency, display_currency)
-            converted_transactions.append({
-                'date': t.date,
-                'status': t.status,
-                'category__name': t.category.name if t.category else 'N/A',
-                'amount': float(converted_amount),
-                'currency': display_currency,
-                'description': t.description,
-            })
+        params = report_params(request.POST)
+        if params['format'] not in REPORT_FORMATS:
+            return JsonResponse({'error': f"Unknown report format {params['format']}"}, status=400)
+
+        if request.POST.get('async') in ('1', 'true'):
+            # Big reports are written by a Celery worker; the client polls report_status for the file
+            job, created = find_or_create_report_job(request.user, params, get_data_version(request.user))
+            if created:
+                transaction.on_commit(lambda: enqueue_report_job(job))
+            data = report_job_status(job)
+            data['status_url'] = reverse('spending_tracker_app:report_status', args=[job.id])
+            return JsonResponse(data, status=202)
+
+        # Query only user's data, with the same filters as in the index view
+        transactions = report_transactions(request.user, params)
+        extension, content_type, writer = REPORT_FORMATS[params['format']]
+        if params['format'] == 'excel':
+            report = spooled_excel_report(transactions, params['display_currency'])
+        else:
+            report = BytesIO()
+            writer(transactions, params['display_currency'], report)
+            report.seek(0)
+        return FileResponse(report, as_attachment=True, filename=f"{params['filename']}.{extension}",
+                            content_type=content_type)
+    return JsonResponse({'error': 'Invalid request method'}, status=400)
 
-        if format == "excel":
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Transactions"
-            ws.append(['Date', 'Status', 'Category', 'Amount', 'Currency', 'Description'])
-            for t in converted_transactions:
-                ws.append([t['date'], t['status'], t['category__name'], t['amount'], t['currency'], t['description']])
-            buffer = BytesIO()
-            wb.save(buffer)
-            buffer.seek(0)
-            response = HttpResponse(buffer,
-                                    content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename={filename}.xlsx'
-            return response
-
-        elif format == "pdf":
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-            from reportlab.lib import colors
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib.units import inch
-
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=LETTER,
-                                    rightMargin=72, leftMargin=72,
-                                    topMargin=72, bottomMargin=18)
-            flowables = []
-            styles = getSampleStyleSheet()
-            flowables.append(Paragraph("Spending Tracker Report", styles["Title"]))
-            flowables.append(Spacer(1, 12))  # some vertical space
-
-            # Define a custom style for wrapped text in the description
-            description_style = ParagraphStyle(
-                'DescriptionStyle',
-                parent=styles['Normal'],
-                wordWrap='CJK',  # Enables word wrapping
-                fontSize=10,
-                leading=12,
-            )
 
-            table_data = [
-                ["Date", "Status", "Category", "Amount", "Currency", "Description"]
-            ]
-            for t in converted_transactions:
-                table_data.append([
-                    t["date"],
-                    t["status"],
-                    t.get("category__name") or "N/A",
-                    str(t["amount"]),
-                    t["currency"],
-                    Paragraph(t["description"], description_style),  # Wrap description text
-                ])
-
-            # Define column widths to ensure description has enough space
-            col_widths = [80, 60, 80, 60, 60, 200]  # Adjust 200 for description to allow wrapping
-            table = Table(table_data, colWidths=col_widths)
-            table.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.Color(0.2, 0.5, 0.8)),  # bluish
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                ("ALIGN", (3, 1), (4, -1), "RIGHT"),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                # Ensure description column wraps text
-                ("LEFTPADDING", (5, 1), (5, -1), 5),
-                ("RIGHTPADDING", (5, 1), (5, -1), 5),
-            ]))
-
-            flowables.append(table)
-
-            doc.build(flowables)
-            buffer.seek(0)
-            response = HttpResponse(buffer, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
-            return response
-    return JsonResponse({'error': 'Invalid request method'}, status=400)
+def enqueue_report_job(job):
+    try:
+        generate_report_job.delay(str(job.id))
+    except Exception as e:  # Broker unreachable; fail the job so polling clients stop and a retry starts afresh
+        logger.error(f"Could not queue report job {job.id}: {str(e)}")
+        ReportJob.objects.filter(id=job.id).update(status='failed', error='Report could not be queued')
+
+
+@login_required
+def report_status(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user)
+    return JsonResponse(report_job_status(job))
+
+
+@login_required
+def download_report(request, job_id):
+    job = get_object_or_404(ReportJob, id=job_id, user=request.user, status='done')
+    if not check_download_token(job, request.GET.get('token')) or job.expires_at <= timezone.now():
+        return JsonResponse({'error': 'Download link has expired'}, status=410)
+    extension, content_type, _ = REPORT_FORMATS[job.params['format']]
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=f"{job.params['filename']}.{extension}",
+                        content_type=content_type)
 
 
 
@@ -1153,10 +1199,12 @@ def add_category(request):
                 return JsonResponse({'error': 'Category name is required and must be a string'}, status=400)
 
             category, created = Category.objects.get_or_create(name=category_name.title(), user=request.user)
-            categories = Category.objects.filter(user=request.user).values('id', 'name')
 
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return JsonResponse({'categories': list(categories)}, encoder=DjangoJSONEncoder, safe=False)
+                return JsonResponse({
+                    'category': {'id': category.id, 'name': category.name},
+                    'version': get_data_version(request.user),
+                })
             else:
                 return redirect('spending_tracker_app:index')
         except Exception as e:
@@ -1166,9 +1214,12 @@ def add_category(request):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_version_etag)
 def get_categories(request):
+    version = get_data_version(request.user)
     categories = Category.objects.filter(user=request.user).values('id', 'name')
-    return JsonResponse({'categories': list(categories)}, encoder=DjangoJSONEncoder, safe=False)
+    return JsonResponse({'categories': list(categories), 'version': version}, encoder=DjangoJSONEncoder, safe=False)
 
 
 @login_required
@@ -1201,9 +1252,10 @@ def update_category(request):
                 category.name = new_name
                 category.save()
 
-            # Fetch updated list of categories for the user
-            categories = Category.objects.filter(user=request.user).values('id', 'name')
-            return JsonResponse({'categories': list(categories)}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({
+                'category': {'id': category.id, 'name': category.name},
+                'version': get_data_version(request.user),
+            })
 
         except json.JSONDecodeError as e:
             logger.error(f"Invalid JSON data: {str(e)}")
@@ -1231,8 +1283,7 @@ def delete_category(request, category_id):
             # Delete associated transactions
             Transaction.objects.filter(user=request.user, category=category).delete()
             category.delete()
-            categories = Category.objects.filter(user=request.user).values('id', 'name')
-            return JsonResponse({'categories': list(categories)}, encoder=DjangoJSONEncoder, safe=False)
+            return JsonResponse({'deleted': category_id, 'version': get_data_version(request.user)})
         except Exception as e:
             logger.error(f"Error in delete_category for ID {category_id}: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -1240,44 +1291,104 @@ def delete_category(request, category_id):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@gzip_page
+@condition(etag_func=data_version_etag)
 def get_transactions(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by('-date').values(
-        'id', 'date', 'status', 'category__name', 'amount', 'currency', 'description'
-    )
-    display_currency = request.GET.get('display_currency', 'QAR')  # Get from query params if available
-    converted_transactions = []
-    for t in transactions:
-        conv_amount = convert_currency(Decimal(str(t['amount'])), t['currency'], display_currency)
-        converted_transactions.append({
-            'id': t['id'],
-            'date': t['date'],
-            'status': t['status'],
-            'category__name': t['category__name'],
-            'amount': float(conv_amount),
-            'currency': display_currency,
-            'description': t['description'],
-        })
-    return JsonResponse({'transactions': converted_transactions}, encoder=DjangoJSONEncoder, safe=False)
+    """
+    Returns one page of the user's filtered transactions. Pass the previous response's
+    next_cursor as ?cursor= to get the following page; next_cursor is null on the last page.
+    With ?stream=1 every matching transaction is streamed in a single response instead.
+    """
+    transactions = filter_transactions(Transaction.objects.filter(user=request.user), request.GET)
+    daily_totals = filter_daily_totals(request.user, request.GET)
+    if request.GET.get('stream') == '1':
+        version = get_data_version(request.user)
+        return StreamingHttpResponse(
+            stream_transactions_json(transactions, daily_totals, request.GET.get('display_currency', 'QAR'), version),
+            content_type='application/json',
+        )
+    return transaction_page_response(request, transactions, daily_totals)
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_version_etag)
+def changes(request):
+    """
+    Returns what changed since ?since=<version>: for transactions, categories and plans,
+    the current state of every upserted object and the ids of deleted ones, plus the
+    version to pass as since next time. Transaction amounts are in ?display_currency=.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return JsonResponse({'error': 'since must be an integer version'}, status=400)
+    try:
+        version = get_data_version(request.user)  # Read first so nothing newer is skipped next time
+        entries = ChangeLogEntry.objects.filter(
+            user=request.user, version__gt=since, version__lte=version
+        ).values_list('entity', 'object_id', 'deleted')
+        upserted = {'transaction': [], 'category': [], 'plan': []}
+        deleted = {'transaction': [], 'category': [], 'plan': []}
+        for entity, object_id, is_deleted in entries:
+            (deleted if is_deleted else upserted)[entity].append(object_id)
+
+        transaction_rows = Transaction.objects.filter(user=request.user, id__in=upserted['transaction']) \
+            .order_by('-date', '-id').values(*TRANSACTION_FIELDS)
+        category_rows = Category.objects.filter(user=request.user, id__in=upserted['category']).values('id', 'name')
+        plan_rows = Plan.objects.filter(user=request.user, id__in=upserted['plan']).prefetch_related('categories')
+        data = {
+            'version': version,
+            'transactions': {
+                'upserted': serialize_transactions(list(transaction_rows),
+                                                   request.GET.get('display_currency', 'QAR')),
+                'deleted': deleted['transaction'],
+            },
+            'categories': {'upserted': list(category_rows), 'deleted': deleted['category']},
+            'plans': {'upserted': [serialize_plan(plan) for plan in plan_rows], 'deleted': deleted['plan']},
+        }
+        # Objects deleted since the version was read are reported as deleted now (their tombstone follows next sync)
+        for key, entity in (('transactions', 'transaction'), ('categories', 'category'), ('plans', 'plan')):
+            found = {row['id'] for row in data[key]['upserted']}
+            data[key]['deleted'] += [object_id for object_id in upserted[entity] if object_id not in found]
+        return JsonResponse(data, encoder=DjangoJSONEncoder)
+    except Exception as e:
+        logger.error(f"Error in changes view: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def plans_for_category(user, category_name):
+    """Plans of the user that track category_name, either directly or through an "all" category."""
+    return Plan.objects.filter(user=user).filter(
+        Q(categories__name=category_name) | Q(categories__name__iexact='all')
+    ).distinct()
+
+
+def adjust_plans(user, plans, left_money):
+    """
+    Sets left_money on every plan in the queryset with one UPDATE over a subquery of their ids.
+    left_money is an expression on F('left_money'), so the database applies concurrent
+    adjustments one after the other instead of overwriting each other.
+    The UPDATE skips post_save, so the changes are recorded for the change feed here.
+    """
+    with transaction.atomic():
+        matching = plans.values('id')
+        updated = Plan.objects.filter(id__in=matching).update(left_money=left_money)
+        if updated:
+            record_changes(user.id, 'plan', matching.values_list('id', flat=True))
+    return updated
 
 
 def deduct_from_plans(user, category_name, amount):
-    plans = Plan.objects.filter(user=user, status='Active')
     today = datetime.date.today()
-    for plan in plans:
-        if plan.from_date <= today <= plan.to_date:  # Simplified date comparison
-            if plan.categories.filter(name=category_name).exists() or \
-                    'all' in [c.name.lower() for c in plan.categories.all()]:
-                plan.left_money = max(Decimal('0'), plan.left_money - Decimal(str(amount)))
-                plan.save()
+    plans = plans_for_category(user, category_name).filter(status='Active', from_date__lte=today, to_date__gte=today)
+    return adjust_plans(user, plans, Greatest(F('left_money') - Decimal(str(amount)), Value(Decimal('0')),
+                                              output_field=DecimalField(max_digits=10, decimal_places=2)))
 
 
 def add_to_plans(user, category_name, amount):
-    plans = Plan.objects.filter(user=user)
-    for plan in plans:
-        if plan.categories.filter(name=category_name).exists() or \
-                'all' in [c.name.lower() for c in plan.categories.all()]:
-            plan.left_money += Decimal(str(amount))
-            plan.save()
+    return adjust_plans(user, plans_for_category(user, category_name), F('left_money') + Decimal(str(amount)))
 
 
 @login_required
@@ -1305,10 +1416,11 @@ def change_password(request):
             update_session_auth_hash(request, request.user)  # Keep user logged in
             return redirect('spending_tracker_app:profile')
         else:
+            summary = get_financial_summary(request.user, request.user.userprofile.preferred_currency)
             return render(request, 'profile.html', {
-                'total_earned': request.session.get('total_earned', 0),
-                'total_spent': request.session.get('total_spent', 0),
-                'ai_recommendation': request.session.get('ai_recommendation', ''),
+                'total_earned': float(summary.total_earned),
+                'total_spent': float(summary.total_spent),
+                'ai_recommendation': summary.ai_recommendation,
                 'error': 'Old password is incorrect'
             })
     return redirect('spending_tracker_app:profile')